@@ -0,0 +1 @@
+"""Single command-line entry point for the budget pipeline: `python -m budget <stage>`."""
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import statistics
+import subprocess
+from typing import List, Optional
+
+# Only the standard library is imported here. Each subcommand imports the
+# stage it runs, and stage arguments are checked against the stdlib-only
+# parsers in chains.cli first, so `--help`, argument errors, `bench-startup`
+# and `parse` never pay for langgraph/langchain imports they do not use.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run_stage(name: str, module: str, rest: List[str]) -> None:
+    from chains.cli import STAGE_PARSERS
+    # Exits here on --help or bad arguments, before the stage module is imported.
+    STAGE_PARSERS[name](f"python -m budget {name}").parse_args(rest)
+    importlib.import_module(module).main(rest)
+
+
+def cmd_parse(args: argparse.Namespace, rest: List[str]) -> None:
+    _run_stage("parse", "chains.parse", rest)
+
+
+def cmd_extract(args: argparse.Namespace, rest: List[str]) -> None:
+    _run_stage("extract", "chains.field_extraction_chain", rest)
+
+
+def cmd_dates(args: argparse.Namespace, rest: List[str]) -> None:
+    _run_stage("dates", "chains.normalize_date_chain", rest)
+
+
+def cmd_qa(args: argparse.Namespace, rest: List[str]) -> None:
+    _run_stage("qa", "chains.qa_chain", rest)
+
+
+def cmd_serve(args: argparse.Namespace, rest: List[str]) -> None:
+    _run_stage("serve", "chains.qa_service", rest)
+
+
+def _parse_is_current(output_path: str, stamp_path: str, source: str) -> bool:
+    """True if `output_path` is the unmodified parse output of the PDF fingerprinted as `source`."""
+    from utils.journal import file_fingerprint
+
+    if not (os.path.isfile(output_path) and os.path.isfile(stamp_path)):
+        return False
+    with open(stamp_path, "r", encoding="utf-8") as f:
+        stamp = json.load(f)
+    return stamp.get("source") == source and stamp.get("output") == file_fingerprint(output_path)
+
+
+def cmd_pipeline(args: argparse.Namespace, rest: List[str]) -> None:
+    """parse -> extract -> dates in one process, reusing the parsed document in memory."""
+    import yaml
+    from dotenv import load_dotenv
+
+    from chains.parse import parse_pdf
+    from chains.field_extraction_chain import extract_fields
+    from chains.normalize_date_chain import normalize_dates
+    from utils.journal import file_fingerprint
+    from utils.model import CheckpointConfig, ConfigModel, ExtractedTextModel
+    from utils.model_provider import configure_model_provider
+    from utils.profiling import enable_profiling, profile_stage
+
+    load_dotenv()
+    if args.profile:
+        enable_profiling(args.profile)
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    configure_model_provider(config)
+
+    pdf_fp = args.input or config.get("pdf_fp")
+    if not pdf_fp or not os.path.isfile(pdf_fp):
+        raise ValueError(" 'pipeline' needs a single PDF: set 'pdf_fp' in config.yaml or pass --input.")
+
+    # parse is skipped when its output was written by an earlier pipeline run for
+    # this PDF and has not changed since, so a rerun after a failure in extract
+    # or dates does not redo layout analysis and OCR.
+    output_path = config["extracted_text_path"]
+    source = file_fingerprint(pdf_fp)
+    stamp_path = output_path + ".source.json"
+    stage_start = time.perf_counter()
+    if not args.force_parse and _parse_is_current(output_path, stamp_path, source):
+        with open(output_path, "r", encoding="utf-8") as f:
+            structured_output = json.load(f)
+        print(f"[INFO] parse skipped: {output_path} is current for {pdf_fp} (use --force-parse to redo it)")
+    else:
+        structured_output, journal = parse_pdf(pdf_fp, CheckpointConfig(**(config.get("checkpoint") or {})))
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(structured_output, f, ensure_ascii=False, indent=2)
+        with open(stamp_path, "w", encoding="utf-8") as f:
+            json.dump({"source": source, "output": file_fingerprint(output_path)}, f)
+        if journal is not None:
+            journal.complete()
+        print(f"[INFO] parse finished in {time.perf_counter() - stage_start:.1f}s -> {output_path}")
+
+    # Later stages get the in-memory document. The fingerprint is content-based
+    # and matches what the standalone stages compute, so their checkpoint
+    # journals carry over between pipeline and standalone runs.
+    fingerprint = file_fingerprint(output_path)
+
+    stage_start = time.perf_counter()
+    extract_fields(config, structured_output, fingerprint)
+    print(f"[INFO] extract finished in {time.perf_counter() - stage_start:.1f}s")
+
+    stage_start = time.perf_counter()
+    with profile_stage("dates.load"):
+        extracted = ExtractedTextModel(**structured_output)
+    normalize_dates(ConfigModel(**config), extracted, fingerprint)
+    print(f"[INFO] dates finished in {time.perf_counter() - stage_start:.1f}s")
+
+
+BENCH_TARGETS = [
+    ("python -m budget --help", ["-m", "budget", "--help"]),
+    ("python -m budget qa --help", ["-m", "budget", "qa", "--help"]),
+    ("import chains.parse", ["-c", "import chains.parse"]),
+    ("import chains.field_extraction_chain", ["-c", "import chains.field_extraction_chain"]),
+    ("import chains.normalize_date_chain", ["-c", "import chains.normalize_date_chain"]),
+    ("import chains.qa_chain", ["-c", "import chains.qa_chain"]),
+    ("import mcp_server.search_budget_server", ["-c", "import mcp_server.search_budget_server"]),
+]
+
+
+def cmd_bench_startup(args: argparse.Namespace, rest: List[str]) -> None:
+    """Time cold interpreter start-up for the CLI and for importing each stage module."""
+    print(f"{'target':<42} {'median ms':>10} {'min ms':>10}")
+    for label, cmd in BENCH_TARGETS:
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            proc = subprocess.run(
+                [sys.executable, *cmd], cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            )
+            samples.append((time.perf_counter() - start) * 1000)
+            if proc.returncode != 0:
+                print(f"{label:<42} failed: {proc.stderr.decode(errors='replace').strip().splitlines()[-1:]}")
+                break
+        else:
+            print(f"{label:<42} {statistics.median(samples):>10.0f} {min(samples):>10.0f}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m budget", description="Government budget pipeline")
+    sub = parser.add_subparsers(dest="command", required=True, metavar="<stage>")
+
+    # Stage subcommands forward their remaining arguments to the stage's own
+    # parser, so `python -m budget qa --help` shows the same options as before.
+    for name, handler, help_text in [
+        ("parse", cmd_parse, "Parse a PDF (or a directory of PDFs into a sharded corpus)."),
+        ("extract", cmd_extract, "Extract financial fields from parsed text (Part 1)."),
+        ("dates", cmd_dates, "Normalize dates and summarize pages (Part 2)."),
+        ("qa", cmd_qa, "Answer a question with the supervisor graph (Part 3)."),
+        ("serve", cmd_serve, "Run the long-lived HTTP service."),
+    ]:
+        p = sub.add_parser(name, help=help_text, add_help=False)
+        p.set_defaults(handler=handler)
+
+    p = sub.add_parser("pipeline", help="Run parse -> extract -> dates in one process.")
+    p.add_argument("--config", type=str, default="config.yaml", help="Path to YAML config file.")
+    p.add_argument("--input", type=str, default=None, help="PDF file to process (defaults to pdf_fp).")
+    p.add_argument("--force-parse", action="store_true", help="Parse the PDF even if its previous output is current.")
+    p.add_argument("--profile", type=str, default=None, metavar="DIR", help="Write per-stage CPU and allocation profiles to DIR.")
+    p.set_defaults(handler=cmd_pipeline)
+
+    p = sub.add_parser("bench-startup", help="Measure CLI and stage import start-up time.")
+    p.add_argument("--repeat", type=int, default=5, help="Runs per target.")
+    p.set_defaults(handler=cmd_bench_startup)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args, rest = build_parser().parse_known_args(argv)
+    if rest and args.handler in (cmd_pipeline, cmd_bench_startup):
+        build_parser().error(f"unrecognized arguments: {' '.join(rest)}")
+    args.handler(args, rest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import argparse
+from typing import Callable, Dict, Optional
+
+# Argument parsers for every stage, kept free of third-party imports so that
+# `python -m budget <stage> --help` and argument errors are answered without
+# loading langchain/langgraph/pdfplumber. Each stage's main() uses the same parser.
+
+
+def _add_common(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument("--config", type=str, default="config.yaml", help="Path to YAML config file.")
+    parser.add_argument("--profile", type=str, default=None, metavar="DIR", help="Write per-stage CPU and allocation profiles to DIR.")
+    return parser
+
+
+def parse_parser(prog: Optional[str] = None) -> argparse.ArgumentParser:
+    parser = _add_common(argparse.ArgumentParser(prog=prog, description="Parse budget PDFs into structured text"))
+    parser.add_argument("--input", type=str, default=None, help="PDF file, or a directory of PDFs to build a sharded corpus (defaults to pdf_dir, then pdf_fp).")
+    return parser
+
+
+def extract_parser(prog: Optional[str] = None) -> argparse.ArgumentParser:
+    return _add_common(argparse.ArgumentParser(prog=prog, description="Extract financial fields from parsed budget text"))
+
+
+def dates_parser(prog: Optional[str] = None) -> argparse.ArgumentParser:
+    return _add_common(argparse.ArgumentParser(prog=prog, description="Normalize budget dates and summarize pages"))
+
+
+def qa_parser(prog: Optional[str] = None) -> argparse.ArgumentParser:
+    parser = _add_common(argparse.ArgumentParser(prog=prog, description="Government Budget Supervisor Pipeline"))
+    parser.add_argument("--query", type=str, required=True, help="User query to analyze.")
+    parser.add_argument("--stream", action="store_true", help="Stream agent progress and the final answer as it is produced.")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the answer cache for this query.")
+    parser.add_argument("--thread-id", type=str, default=None, help="Checkpoint thread to start or resume (defaults to a hash of the query).")
+    parser.add_argument("--deadline", type=float, default=None, help="Time budget in seconds for the whole query (overrides resilience.query_deadline_s).")
+    return parser
+
+
+def serve_parser(prog: Optional[str] = None) -> argparse.ArgumentParser:
+    parser = _add_common(argparse.ArgumentParser(prog=prog, description="Long-lived local HTTP service for the budget pipeline"))
+    parser.add_argument("--host", type=str, default=None, help="Override service.host from config.")
+    parser.add_argument("--port", type=int, default=None, help="Override service.port from config.")
+    return parser
+
+
+STAGE_PARSERS: Dict[str, Callable[[Optional[str]], argparse.ArgumentParser]] = {
+    "parse": parse_parser,
+    "extract": extract_parser,
+    "dates": dates_parser,
+    "qa": qa_parser,
+    "serve": serve_parser,
+}
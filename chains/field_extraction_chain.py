@@ -4,17 +4,16 @@ warnings.filterwarnings("ignore")
 import os
 import json
 import yaml
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 from pydantic import BaseModel
 
-
-from dotenv import load_dotenv
-load_dotenv()
-
 from utils.prompts import FIELD_EXTRACTION_PROMPT
-from utils.model import FinancialFields
+from utils.model import FinancialFields, CheckpointConfig
+from utils.model_provider import configure_model_provider, get_model_provider
+from utils.journal import ProgressJournal, file_fingerprint
+from utils.profiling import enable_profiling, profiled
+from chains.cli import extract_parser
 
 
 class FieldExtractionChain:
@@ -23,13 +22,15 @@ class FieldExtractionChain:
     from selected pages in a parsed Budget document.
     """
 
-    def __init__(self, model: str = "gemini-2.5-flash"):
-        self.model = ChatGoogleGenerativeAI(
+    def __init__(self, model: Optional[str] = None, journal: Optional[ProgressJournal] = None):
+        self.journal = journal
+        self.model = get_model_provider().chat_model(
             model=model,
-            temperature=0,
+            priority="batch",
             convert_system_message_to_human=True,
         ).with_structured_output(FinancialFields)
 
+    @profiled("extract")
     def run(
         self,
         structured_text: Dict[str, Any],
@@ -56,10 +57,16 @@ class FieldExtractionChain:
                 print(f"[INFO] Skipping empty page {page}")
                 continue
 
+            if self.journal is not None and str(page) in self.journal:
+                results = self._merge_results(results, self.journal.get(str(page)))
+                continue
+
             prompt = prompt_template.format(text_block=page_text)
 
             structured_resp = self.model.invoke(prompt)
             page_data = structured_resp.model_dump()
+            if self.journal is not None:
+                self.journal.record(str(page), page_data)
             results = self._merge_results(results, page_data)
             print(f"[INFO] Structured extraction successful for page {page}")
 
@@ -77,14 +84,47 @@ class FieldExtractionChain:
         return base
 
 
-def main():
+def extract_fields(config: Dict[str, Any], structured_text: Dict[str, Any], fingerprint: str) -> str:
+    """Run field extraction over already-parsed text and save it; returns the output path."""
+    target_pages = config.get("target_pages_part_1", [])
+    gemini_model = config.get("gemini_model") or get_model_provider().config.gemini_model
+
+    checkpoint = CheckpointConfig(**(config.get("checkpoint") or {}))
+    journal = (
+        ProgressJournal(
+            checkpoint.dir, "extract", fingerprint, target_pages, gemini_model, FIELD_EXTRACTION_PROMPT
+        )
+        if checkpoint.enabled
+        else None
+    )
+
+    extractor = FieldExtractionChain(model=gemini_model, journal=journal)
+    results = extractor.run(structured_text, target_pages, FIELD_EXTRACTION_PROMPT)
+
+    # Save results to JSON
+    output_fp = config["extracted_field_path"]
+    with open(output_fp, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if journal is not None:
+        journal.complete()
+
+    print(f"Field extraction complete. Results saved to: {output_fp}")
+    return output_fp
+
+
+def main(argv: Optional[List[str]] = None):
+    args = extract_parser().parse_args(argv)
+    load_dotenv()
+    if args.profile:
+        enable_profiling(args.profile)
+
     # Load config
-    with open("config.yaml", "r", encoding="utf-8") as f:
+    with open(args.config, "r", encoding="utf-8") as f:
         config = yaml.safe_load(f)
+    configure_model_provider(config)
 
     structured_json_fp = config.get("extracted_text_path")
-    target_pages = config.get("target_pages_part_1", [])
-    gemini_model = config.get("gemini_model", "gemini-2.5-flash")
 
     if not structured_json_fp or not os.path.exists(structured_json_fp):
         raise FileNotFoundError("extracted_text_path not found in config.yaml or file missing.")
@@ -92,15 +132,8 @@ def main():
     with open(structured_json_fp, "r", encoding="utf-8") as f:
         structured_text = json.load(f)
 
-    extractor = FieldExtractionChain(model=gemini_model)
-    results = extractor.run(structured_text, target_pages, FIELD_EXTRACTION_PROMPT)
+    extract_fields(config, structured_text, file_fingerprint(structured_json_fp))
 
-    # Save results to JSON
-    output_fp = config["extracted_field_path"]
-    with open(output_fp, "w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
-
-    print(f"Field extraction complete. Results saved to: {output_fp}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
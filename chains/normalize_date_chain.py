@@ -4,26 +4,30 @@ warnings.filterwarnings("ignore")
 import os
 import json
 import yaml
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from dotenv import load_dotenv
 from langchain_core.tools import tool
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.prebuilt import create_react_agent
 
 from utils.prompts import REASONING_NORMALIZED_DATE_PROMPT, NORMALIZED_DATE_AGENT_PROMPT
 from utils.model import ExtractedTextModel, Part2AnswerSchema, ConfigModel
+from utils.journal import ProgressJournal, file_fingerprint
+from utils.profiling import enable_profiling, profile_stage, profiled
+from utils.model_provider import configure_model_provider, get_model_provider
 from mcp_client.mcp_client import MCPClient
+from chains.cli import dates_parser
 
 
 
 class BudgetDatePipeline:
-    def __init__(self, config: ConfigModel, extracted: ExtractedTextModel):
+    def __init__(self, config: ConfigModel, extracted: ExtractedTextModel, journal: Optional[ProgressJournal] = None):
         self.config = config
         self.extracted = extracted
+        self.journal = journal
         
         # Initialize MCP client
-        self.mcp_client = MCPClient("mcp_server/normalize_date_server.py")
+        self.mcp_client = MCPClient(config.mcp_servers.normalize_date)
 
         # Register tool
         @tool("normalize_date", return_direct=True)
@@ -31,22 +35,19 @@ class BudgetDatePipeline:
             """Normalize budget-style dates to ISO (YYYY-MM-DD)."""
             return self.mcp_client.call(date_string)
 
-        # LLM setup
-        self.model = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0,
+        # LLM setup (one shared client, rate limited with the rest of the project)
+        self.model = get_model_provider().chat_model(
+            model=self.config.gemini_model,
+            priority="batch",
             convert_system_message_to_human=True,
         )
 
-        self.strucutured_model = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0,
-            convert_system_message_to_human=True,
-        ).with_structured_output(Part2AnswerSchema)
+        self.strucutured_model = self.model.with_structured_output(Part2AnswerSchema)
 
         
         self.agent = create_react_agent(model=self.model, tools=[normalize_date], prompt=NORMALIZED_DATE_AGENT_PROMPT)
 
+    @profiled("dates")
     def process_pages(self) -> Dict[int, List[Dict[str, Any]]]:
         page_results = []
 
@@ -54,11 +55,16 @@ class BudgetDatePipeline:
             page_elems = [e for e in self.extracted.elements if e["page"] == page]
             
 
-            for elem in page_elems:
+            for idx, elem in enumerate(page_elems):
                 text = elem.get("content_markdown", "")
                 if not text.strip():
                     continue
 
+                unit = f"{page}:{idx}"
+                if self.journal is not None and unit in self.journal:
+                    page_results.append(self.journal.get(unit))
+                    continue
+
                 # Part 1
                 norm_response = self.agent.invoke({"messages": [{"role": "user", "content": "Text: " + text}]})
                 normalized_output = norm_response["messages"][-1].content
@@ -66,28 +72,25 @@ class BudgetDatePipeline:
                 summary_response = self.strucutured_model.invoke(REASONING_NORMALIZED_DATE_PROMPT.format(normalized_output, text))
                 
                 page_results.append(summary_response.model_dump())
+                if self.journal is not None:
+                    self.journal.record(unit, summary_response.model_dump())
                 print(summary_response.model_dump(), page_results)
         return page_results
 
-if __name__ == "__main__":
-    # Load environment variables
-    load_dotenv()
-    if not os.getenv("GOOGLE_API_KEY"):
-        raise EnvironmentError("Missing GOOGLE_API_KEY in .env")
-
-    # Load YAML config
-    with open("config.yaml", "r") as f:
-        cfg_dict = yaml.safe_load(f)
-    config = ConfigModel(**cfg_dict)
-
-    # Load extracted JSON
-    with open(config.extracted_text_path, "r") as f:
-        extracted_json = json.load(f)
-    
-    extracted = ExtractedTextModel(**extracted_json)
+def normalize_dates(config: ConfigModel, extracted: ExtractedTextModel, fingerprint: str) -> str:
+    """Normalize dates on the configured pages of already-parsed text and save them; returns the output path."""
+    journal = (
+        ProgressJournal(
+            config.checkpoint.dir, "dates", fingerprint,
+            config.target_pages_part_2, config.gemini_model,
+            NORMALIZED_DATE_AGENT_PROMPT, REASONING_NORMALIZED_DATE_PROMPT,
+        )
+        if config.checkpoint.enabled
+        else None
+    )
 
     # Initialize pipeline
-    pipeline = BudgetDatePipeline(config=config, extracted=extracted)
+    pipeline = BudgetDatePipeline(config=config, extracted=extracted, journal=journal)
 
     # Run pipeline 
     results = pipeline.process_pages()
@@ -100,4 +103,38 @@ if __name__ == "__main__":
     with open(output_path, "w", encoding="utf-8") as f:
         json.dump(results, f, indent=2, ensure_ascii=False)
 
-    print(f"\n Full normalization + summarization results saved to: {output_path}")
\ No newline at end of file
+    if journal is not None:
+        journal.complete()
+
+    print(f"\n Full normalization + summarization results saved to: {output_path}")
+    return output_path
+
+
+def main(argv: Optional[List[str]] = None):
+    args = dates_parser().parse_args(argv)
+
+    # Load environment variables
+    load_dotenv()
+    if args.profile:
+        enable_profiling(args.profile)
+    if not os.getenv("GOOGLE_API_KEY"):
+        raise EnvironmentError("Missing GOOGLE_API_KEY in .env")
+
+    # Load YAML config
+    with open(args.config, "r") as f:
+        cfg_dict = yaml.safe_load(f)
+    configure_model_provider(cfg_dict)
+    config = ConfigModel(**cfg_dict)
+
+    # Load extracted JSON
+    with profile_stage("dates.load"):
+        with open(config.extracted_text_path, "r") as f:
+            extracted_json = json.load(f)
+        
+        extracted = ExtractedTextModel(**extracted_json)
+
+    normalize_dates(config, extracted, file_fingerprint(config.extracted_text_path))
+
+
+if __name__ == "__main__":
+    main()
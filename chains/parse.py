@@ -2,50 +2,100 @@ import warnings
 warnings.filterwarnings("ignore")
 
 import io
+import os
+import re
+import glob
 import yaml
+import hashlib
 import pdfplumber
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import json
 
 from utils.call_gemini import GeminiAPIClient
+from utils.journal import ProgressJournal, file_fingerprint
+from utils.model import CheckpointConfig
+from utils.model_provider import configure_model_provider
+from utils.profiling import enable_profiling, profile_stage, profiled
+from chains.cli import parse_parser
 
 from dotenv import load_dotenv
-load_dotenv()
+
+MANIFEST_NAME = "manifest.json"
+DEFAULT_CORPUS_DIR = "./data/corpus"
+
+
+def document_identity(pdf_path: str) -> Tuple[str, Optional[int]]:
+    """Derive a document id (file stem) and fiscal year (first 4-digit year in the name)."""
+    doc_id = os.path.splitext(os.path.basename(pdf_path))[0]
+    m = re.search(r"(?<!\d)(19|20)\d{2}(?!\d)", doc_id)
+    return doc_id, int(m.group(0)) if m else None
+
 
 class PdfplumberLoader:
     """
     Extracts structured text and tables with pdfplumber.
     Falls back to Gemini OCR and table reconstruction when needed.
+    Every element is tagged with the document id and fiscal year.
     """
 
-    def __init__(self, pdf_path: str, ocr_threshold: int = 30):
+    def __init__(
+        self,
+        pdf_path: str,
+        ocr_threshold: int = 30,
+        journal: Optional[ProgressJournal] = None,
+        doc_id: Optional[str] = None,
+        year: Optional[int] = None,
+    ):
         self.pdf_path = pdf_path
         self.ocr_threshold = ocr_threshold
         self.gemini = GeminiAPIClient()
+        self.journal = journal
+        default_id, default_year = document_identity(pdf_path)
+        self.doc_id = doc_id or default_id
+        self.year = year if year is not None else default_year
 
+    @profiled("parse")
     def load(self) -> Dict[str, Any]:
-        structured = {"metadata": {"source": self.pdf_path}, "elements": []}
+        structured = {
+            "metadata": {"source": self.pdf_path, "doc_id": self.doc_id, "year": self.year},
+            "elements": [],
+        }
         ocr_pages: List[int] = []
 
         with pdfplumber.open(self.pdf_path) as pdf:
             for page_num, page in enumerate(pdf.pages, start=1):
-                text = (page.extract_text() or "").strip()
+                # Skip pages finished by an earlier, interrupted run
+                if self.journal is not None and str(page_num) in self.journal:
+                    done = self.journal.get(str(page_num))
+                    structured["elements"].append(done["element"])
+                    if done["ocr"]:
+                        ocr_pages.append(page_num)
+                    continue
+
+                # Per-page sub-stages skip allocation snapshots; the whole "parse" stage has them.
+                with profile_stage("parse.layout", allocations=False):
+                    text = (page.extract_text() or "").strip()
+                used_ocr = False
 
                 #  OCR fallback if text missing
                 if len(text) < self.ocr_threshold:
-                    img = page.to_image(resolution=300).original
-                    buf = io.BytesIO()
-                    img.save(buf, format="PNG")
-
-                    ocr_resp = self.gemini.generate_content(
-                        "Extract all visible text and numbers from this document image.",
-                        image_bytes=buf.getvalue()
-                    )
+                    with profile_stage("parse.png", allocations=False):
+                        img = page.to_image(resolution=300).original
+                        buf = io.BytesIO()
+                        img.save(buf, format="PNG")
+
+                    with profile_stage("parse.ocr", allocations=False):
+                        ocr_resp = self.gemini.generate_content(
+                            "Extract all visible text and numbers from this document image.",
+                            image_bytes=buf.getvalue()
+                        )
                     text = ocr_resp.text
                     ocr_pages.append(page_num)
+                    used_ocr = True
 
                 # Extract tables
-                tables = page.extract_tables()
+                with profile_stage("parse.layout", allocations=False):
+                    tables = page.extract_tables()
                 table_md_blocks = []
                 for t in tables or []:
                     if not t:
@@ -69,11 +119,15 @@ class PdfplumberLoader:
                         print(f"[WARN] Table parsing failed on page {page_num}: {e}")
                         continue
 
-                structured["elements"].append({
+                element = {
+                    "doc_id": self.doc_id,
+                    "year": self.year,
                     "page": page_num,
                     "content_markdown": text,
-                })
-
+                }
+                structured["elements"].append(element)
+                if self.journal is not None:
+                    self.journal.record(str(page_num), {"element": element, "ocr": used_ocr})
 
         print(f"[INFO] Gemini OCR triggered on pages: {ocr_pages or 'None'}")
         return structured
@@ -87,23 +141,96 @@ class PdfplumberLoader:
                 md.append("|" + "|".join(["---"] * len(row)) + "|")
         return "\n".join(md)
     
-def main():
+def write_corpus(documents: List[Dict[str, Any]], corpus_dir: str, shard_size: int = 200) -> str:
+    """
+    Split parsed documents into shard files of at most `shard_size` elements
+    and write a manifest describing each shard. Returns the manifest path.
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    manifest = {"documents": [], "shards": []}
+    for doc in documents:
+        meta = doc["metadata"]
+        elements = doc["elements"]
+        manifest["documents"].append({**meta, "pages": len(elements)})
+        for i in range(0, max(len(elements), 1), shard_size):
+            shard = {"metadata": meta, "elements": elements[i:i + shard_size]}
+            body = json.dumps(shard, ensure_ascii=False, indent=2)
+            name = f"{meta['doc_id']}-{i // shard_size:03d}.json"
+            with open(os.path.join(corpus_dir, name), "w", encoding="utf-8") as f:
+                f.write(body)
+            manifest["shards"].append({
+                "path": name,
+                "doc_id": meta["doc_id"],
+                "year": meta["year"],
+                "elements": len(shard["elements"]),
+                "sha256": hashlib.sha256(body.encode("utf-8")).hexdigest(),
+            })
+
+    manifest_path = os.path.join(corpus_dir, MANIFEST_NAME)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest_path
+
+
+def parse_pdf(pdf_fp: str, checkpoint: CheckpointConfig) -> Tuple[Dict[str, Any], Optional[ProgressJournal]]:
+    journal = (
+        ProgressJournal(checkpoint.dir, "parse", file_fingerprint(pdf_fp))
+        if checkpoint.enabled
+        else None
+    )
+    loader = PdfplumberLoader(pdf_path=pdf_fp, journal=journal)
+    return loader.load(), journal
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_parser().parse_args(argv)
+    load_dotenv()
+    if args.profile:
+        enable_profiling(args.profile)
+
     # Load config file
-    with open("config.yaml", "r", encoding="utf-8") as f:
+    with open(args.config, "r", encoding="utf-8") as f:
         config = yaml.safe_load(f)
+    configure_model_provider(config)
 
-    pdf_fp = config.get("pdf_fp")
+    pdf_fp = args.input or config.get("pdf_dir") or config.get("pdf_fp")
     if not pdf_fp:
         raise ValueError(" Missing 'pdf_fp' in config.yaml.")
 
-    loader = PdfplumberLoader(pdf_path=pdf_fp)
-    structured_output = loader.load()
+    checkpoint = CheckpointConfig(**(config.get("checkpoint") or {}))
+
+    if os.path.isdir(pdf_fp):
+        corpus_dir = config.get("corpus_dir") or DEFAULT_CORPUS_DIR
+        pdf_paths = sorted(glob.glob(os.path.join(pdf_fp, "*.pdf")))
+        if not pdf_paths:
+            raise FileNotFoundError(f"No PDF files found in {pdf_fp}")
+
+        documents, journals = [], []
+        for path in pdf_paths:
+            print(f"[INFO] Parsing {path}")
+            structured_output, journal = parse_pdf(path, checkpoint)
+            documents.append(structured_output)
+            journals.append(journal)
+
+        manifest_path = write_corpus(documents, corpus_dir, config.get("corpus_shard_size", 200))
+        for journal in journals:
+            if journal is not None:
+                journal.complete()
+        print(f"Extraction complete. {len(documents)} document(s) sharded into: {os.path.dirname(manifest_path)}")
+        if not config.get("corpus_dir"):
+            print(f"[INFO] Set corpus_dir: \"{corpus_dir}\" in config.yaml so Part 3 searches this corpus.")
+        return
+
+    structured_output, journal = parse_pdf(pdf_fp, checkpoint)
 
     output_path = config["extracted_text_path"]
     
     with open(output_path, "w", encoding="utf-8") as f:
         json.dump(structured_output, f, ensure_ascii=False, indent=2)
 
+    if journal is not None:
+        journal.complete()
+
     print(f"Extraction complete. Output saved to: {output_path}")
 
 
@@ -4,24 +4,35 @@ warnings.filterwarnings("ignore")
 import os
 import json
 import yaml
-import argparse
-from typing import List, Dict, Any
+import sqlite3
+import uuid
+import asyncio
+import hashlib
+import threading
+import contextlib
+from typing import List, Dict, Any, Iterator, AsyncIterator, Optional, Tuple
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import Command
+from langgraph.config import get_stream_writer
+from langgraph.checkpoint.sqlite import SqliteSaver
 from langchain_core.tools import tool
 from langchain.agents import create_agent
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langsmith import traceable
 
 from utils.model import RevenueOutput, ExpenditureOutput, FinalAnswer, Router, BudgetState, Part3ConfigModel
 from utils.prompts import REVENUE_AGENT_PROMPT, EXPENDITURE_AGENT_PROMPT, SUPERVISOR_SYSTEM_PROMPT, REVIEWER_SYSTEM_PROMPT, ROUTER_PROMPT
+from utils.model_provider import configure_model_provider, get_model_provider
+from utils.answer_cache import AnswerCache, content_version
+from utils.deadline import DeadlineExceeded, current_deadline, deadline_scope
+from utils.context_budget import ContextBudget, current_context_budget, context_budget_scope
+from utils.profiling import enable_profiling, profiled
 from mcp_client.mcp_client import MCPClient
+from chains.cli import qa_parser
 
 from langsmith import traceable
 
 from dotenv import load_dotenv
-load_dotenv()
 
 def load_config(path: str = "config.yaml") -> Part3ConfigModel:
     if not os.path.exists(path):
@@ -34,16 +45,25 @@ def load_config(path: str = "config.yaml") -> Part3ConfigModel:
 class BudgetSupervisorPipeline:
     def __init__(self, config: Part3ConfigModel):
         self.config = config
-        self.llm = ChatGoogleGenerativeAI(
+        self.llm = get_model_provider().chat_model(
             model=self.config.model_name,
-            temperature=0,
+            priority="interactive",
         )
 
         self.RevenueParser = self.llm.with_structured_output(RevenueOutput)
         self.ExpenditureParser = self.llm.with_structured_output(ExpenditureOutput)
-        self.Reviewer = self.llm.with_structured_output(FinalAnswer)
 
-        self.mcp_client = MCPClient(server_path="mcp_server/search_budget_server.py")
+        # Search a sharded corpus when configured; its manifest then versions the cache.
+        self.search_path = self.config.corpus_dir or self.config.extracted_text_path
+        self.cache = (
+            AnswerCache(self.config.answer_cache, self._document_version_path(), self.config.model_name)
+            if self.config.answer_cache.enabled
+            else None
+        )
+
+        self.mcp_client = MCPClient(server_path=self.config.mcp_servers.search)
+        self._active_threads: set = set()
+        self._threads_lock = threading.Lock()
         self._init_tools()
         self._init_agents()
         self._init_graph()
@@ -51,19 +71,45 @@ class BudgetSupervisorPipeline:
         
 
 
+    def _document_version_path(self) -> str:
+        if self.config.corpus_dir:
+            return os.path.join(self.config.corpus_dir, "manifest.json")
+        return self.config.extracted_text_path
+
+    def _corpus_catalogue(self) -> str:
+        """One line per document in the corpus, so agents know which filters exist."""
+        if not self.config.corpus_dir:
+            return ""
+        with open(self._document_version_path(), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        lines = [f"- doc_id={d['doc_id']} year={d.get('year')}" for d in manifest.get("documents", [])]
+        return "\nAvailable documents:\n" + "\n".join(lines)
+
     def _init_tools(self):
         mcp_ref = self.mcp_client
-        json_path = self.config.extracted_text_path
+        # Absolute, so a shared MCP server started from another directory resolves the same file.
+        json_path = os.path.abspath(self.search_path)
+        budget_ref = self._context_budget
 
         @tool("search_budget_text", return_direct=True)
-        def search_budget_text(keyword: str) -> List[Dict[str, Any]]:
-            """Call the MCP budget text search server to find text containing the keyword."""
+        def search_budget_text(
+            keyword: str,
+            doc_ids: Optional[List[str]] = None,
+            years: Optional[List[int]] = None,
+        ) -> List[Dict[str, Any]]:
+            """Call the MCP budget text search server to find text containing the keyword.
+            Optionally restrict the search to specific documents (doc_ids) or fiscal years (years)."""
             # Send both keyword and file path to the MCP server
-            return mcp_ref.call(
-                "search_budget_text",
-                arguments={"keyword": keyword, "structured_json_path": json_path},
-            )
-
+            arguments = {"keyword": keyword, "structured_json_path": json_path}
+            if doc_ids:
+                arguments["doc_ids"] = doc_ids
+            if years:
+                arguments["years"] = years
+            result = mcp_ref.call("search_budget_text", arguments=arguments)
+            # Pages already returned by a parallel search in this step are not sent again.
+            return budget_ref().compact_tool_result(result)
+
+        search_budget_text.description += self._corpus_catalogue()
         self.search_budget_text = search_budget_text
 
     def _init_agents(self):
@@ -79,7 +125,71 @@ class BudgetSupervisorPipeline:
             system_prompt=EXPENDITURE_AGENT_PROMPT,
         )
 
+    def _context_budget(self) -> ContextBudget:
+        """Budget of the current run (a throwaway one if a node is called outside run())."""
+        return current_context_budget() or ContextBudget(self.config.context_budget)
+
+    @contextlib.contextmanager
+    def _run_scope(self, deadline_s: Optional[float]):
+        """Per-query deadline and context budget shared by every node, tool and LLM call."""
+        with deadline_scope(deadline_s or self.config.resilience.query_deadline_s):
+            with context_budget_scope(self.config.context_budget) as budget:
+                yield
+                print(f"[CONTEXT] {budget.summary()}")
+
+    def _emit(self, event: str, **payload: Any) -> None:
+        """Send an incremental event to stream() consumers (no-op when not streaming)."""
+        get_stream_writer()({"event": event, **payload})
+
+    def _run_agent(self, agent, node: str, content: str) -> str:
+        """Run a worker agent step by step, emitting its tool calls and results."""
+        last_msg = None
+        # Tool results answering the latest tool-calling message. Parallel calls run as
+        # separate tasks, so their results arrive in separate update chunks.
+        step_results: List[Any] = []
+        with self._context_budget().agent_invocation():
+            for update in agent.stream({"messages": [{"role": "user", "content": content}]}, stream_mode="updates"):
+                for step in update.values():
+                    for msg in (step or {}).get("messages", []):
+                        last_msg = msg
+                        if getattr(msg, "tool_calls", None):
+                            step_results = []
+                        for call in getattr(msg, "tool_calls", None) or []:
+                            self._emit("tool_call", node=node, tool=call["name"], args=call["args"])
+                        if getattr(msg, "type", None) == "tool":
+                            step_results.append(msg)
+                            self._emit("tool_result", node=node, tool=msg.name, content=str(msg.content))
+        if last_msg is None:
+            return ""
+        if getattr(last_msg, "type", None) != "tool":
+            return last_msg.content
+        # The search tool returns directly, so the step's results are the finding. A page
+        # deduped in one parallel search is returned in full by another, so keep them all.
+        return "\n".join(str(msg.content) for msg in step_results)
+
+    @profiled("qa.reviewer")
+    def _review(self, revenue: Any, expenditure: Any, user_query: str) -> Tuple[FinalAnswer, bool]:
+        """
+        Produce the final answer, streaming it token by token.
+        Returns the answer and whether the deadline cut it short.
+        """
+        prompt = REVIEWER_SYSTEM_PROMPT.format(revenue=revenue, expenditure=expenditure, user_query=user_query)
+        self._context_budget().record(-1, "reviewer", prompt)
+        tokens = []
+        try:
+            for chunk in self.llm.stream(prompt):
+                token = chunk.text
+                if token:
+                    tokens.append(token)
+                    self._emit("answer_token", content=token)
+        except DeadlineExceeded:
+            print("[WARN] Query deadline reached while reviewing. Returning the partial answer.")
+            answer = "".join(tokens) or "The query time budget ran out before an answer could be produced."
+            return FinalAnswer(direct_answer=answer), True
+        return FinalAnswer(direct_answer="".join(tokens)), False
+
     @traceable(name="SupervisorNode")
+    @profiled("qa.supervisor")
     def supervisor_node(self, state: Dict[str, Any]) -> Command:
         user_query = state.get("query", "")
         loop_count = state.get("loop_count", 0)
@@ -88,13 +198,21 @@ class BudgetSupervisorPipeline:
         expenditure = state.get("expenditure", "")
         cur_reasoning = state.get("cur_reasoning", "")
 
+        self._emit("node_start", node="supervisor", loop_count=loop_count)
         print(f"\n[Supervisor Loop {loop_count}] - Deciding next worker...")
         print(f"last_node={last_node}")
 
+        deadline = current_deadline()
+        degraded = False
         if loop_count >= self.config.max_loop:
             print("Max loop count reached. Ending process.")
             goto = "FINISH"
             reasoning = "Stopped after maximum allowed loops."
+        elif deadline is not None and deadline.remaining() < self.config.resilience.reviewer_reserve_s:
+            print("[WARN] Query deadline nearly reached. Finishing with current findings.")
+            goto = "FINISH"
+            reasoning = "Stopped because the query time budget is nearly used up."
+            degraded = True
         else:
             members_dict = {
                 "revenue_node": "Handles revenue/tax/income-related queries.",
@@ -121,9 +239,19 @@ class BudgetSupervisorPipeline:
                     ),
                 },
             ]
-            response = router_llm.invoke(messages)
-            goto = response["next"]
-            reasoning = response["reasoning"]
+            prompt_tokens = self._context_budget().record(
+                loop_count, "router", messages[0]["content"] + messages[1]["content"]
+            )
+            self._emit("context", loop=loop_count, prompt="router", tokens=prompt_tokens)
+            try:
+                response = router_llm.invoke(messages)
+                goto = response["next"]
+                reasoning = response["reasoning"]
+            except DeadlineExceeded:
+                print("[WARN] Query deadline reached while routing. Finishing with current findings.")
+                goto = "FINISH"
+                reasoning = "Stopped because the query time budget ran out."
+                degraded = True
 
         print(f"Supervisor routed to: {goto}")
         print(f"Reasoning: {reasoning}")
@@ -133,29 +261,38 @@ class BudgetSupervisorPipeline:
             goto = "FINISH"
             reasoning += " (Stopped because same node repeated.)"
 
+        self._emit("route", next=goto, reasoning=reasoning)
+
         if goto == "FINISH":
-            combined = self.Reviewer.invoke(REVIEWER_SYSTEM_PROMPT.format(revenue=revenue, expenditure= expenditure, user_query= user_query))
+            combined, cut_short = self._review(revenue, expenditure, user_query)
             print("Supervisor completed summary.\n")
             return Command(
                 goto=END,
-                update={"final_output": combined, "cur_reasoning": reasoning},
+                update={"final_output": combined, "cur_reasoning": reasoning, "degraded": degraded or cut_short},
             )
 
         return Command(
             goto=goto,
             update={
                 "query": user_query,
-                "cur_reasoning": reasoning,
+                "cur_reasoning": self._context_budget().compact_reasoning(reasoning),
                 "loop_count": loop_count + 1,
                 "last_node": goto,
             },
         )
 
     @traceable(name="RevenueAgentNode")
+    @profiled("qa.revenue_node")
     def node_revenue(self, state: Dict[str, Any]) -> Dict[str, Any]:
         print("Running Revenue Agent...")
-        resp = self.RevenueAgent.invoke({"messages": [{"role": "user", "content": "Past actions: " + state["query"]}]})
-        raw = resp["messages"][-1].content
+        self._emit("node_start", node="revenue_node")
+        worker_prompt = "Past actions: " + state["query"]
+        self._context_budget().record(state.get("loop_count", 0), "revenue_agent", worker_prompt)
+        try:
+            raw = self._run_agent(self.RevenueAgent, "revenue_node", worker_prompt)
+        except DeadlineExceeded:
+            print("[WARN] Revenue Agent stopped at the query deadline.")
+            return {"revenue": state.get("revenue"), "expenditure": state.get("expenditure"), "query": state["query"]}
         try:
             structured = self.RevenueParser.invoke(
                 f"Convert to JSON with field 'revenue_streams': {raw}"
@@ -164,13 +301,22 @@ class BudgetSupervisorPipeline:
         except Exception as e:
             print(f"RevenueParser failed: {e}")
             revenue_value = raw
-        return {"revenue": revenue_value, "expenditure": state.get("expenditure"),  "Past actions: " +  "query": state["query"]}
+        # Findings are overwritten each visit and kept as a bounded item list, so state size stays bounded.
+        revenue_value = self._context_budget().compact_finding(revenue_value)
+        return {"revenue": revenue_value, "expenditure": state.get("expenditure"), "query": state["query"]}
 
     @traceable(name="ExpenditureAgentNode")
+    @profiled("qa.expenditure_node")
     def node_expenditure(self, state: Dict[str, Any]) -> Dict[str, Any]:
         print("Running Expenditure Agent...")
-        resp = self.ExpenditureAgent.invoke({"messages": [{"role": "user", "content": "Past actions: " + state["query"]}]})
-        raw = resp["messages"][-1].content
+        self._emit("node_start", node="expenditure_node")
+        worker_prompt = "Past actions: " + state["query"]
+        self._context_budget().record(state.get("loop_count", 0), "expenditure_agent", worker_prompt)
+        try:
+            raw = self._run_agent(self.ExpenditureAgent, "expenditure_node", worker_prompt)
+        except DeadlineExceeded:
+            print("[WARN] Expenditure Agent stopped at the query deadline.")
+            return {"expenditure": state.get("expenditure"), "revenue": state.get("revenue"), "query": state["query"]}
         try:
             structured = self.ExpenditureParser.invoke(
                 f"Convert to JSON with field 'expenditure_streams': {raw}"
@@ -179,7 +325,8 @@ class BudgetSupervisorPipeline:
         except Exception as e:
             print(f"ExpenditureParser failed: {e}")
             expenditure_value = raw
-        return {"expenditure": expenditure_value, "revenue": state.get("revenue"), "query": "Past actions: " + state["query"]}
+        expenditure_value = self._context_budget().compact_finding(expenditure_value)
+        return {"expenditure": expenditure_value, "revenue": state.get("revenue"), "query": state["query"]}
 
     def _init_graph(self):
         graph = StateGraph(BudgetState)
@@ -192,18 +339,219 @@ class BudgetSupervisorPipeline:
         graph.add_edge("supervisor", END)
         self.app = graph.compile()
 
-    def run(self, user_query: str):
+        # Checkpointed copy of the graph for run()/stream(): state is saved after
+        # every node, so an interrupted thread resumes from the last completed node.
+        self.durable_app = None
+        if self.config.checkpoint.enabled:
+            os.makedirs(self.config.checkpoint.dir, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.config.checkpoint.dir, "qa_graph.sqlite"), check_same_thread=False)
+            self.durable_app = graph.compile(checkpointer=SqliteSaver(conn))
+
+    @contextlib.contextmanager
+    def _prepare_run(
+        self, user_query: str, thread_id: Optional[str]
+    ) -> Iterator[Tuple[Any, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+        """
+        Pick the graph, its input and run config. When a checkpointed thread was
+        interrupted, the input is None so LangGraph resumes it instead of starting over.
+        The thread is reserved for this run until the block exits.
+        """
+        fresh = {
+            "query": user_query, "loop_count": 0, "last_node": None,
+            "revenue": "", "expenditure": "", "cur_reasoning": "", "final_output": None, "degraded": False,
+        }
+        if self.durable_app is None:
+            yield self.app, fresh, None
+            return
+
+        explicit = thread_id is not None
+        if not explicit:
+            # Derived from the query and the document/prompt/model version, so re-running a failed
+            # command resumes it, but a thread left over from before a re-parse or prompt edit does not.
+            version = content_version(self._document_version_path(), self.config.model_name)
+            thread_id = hashlib.sha256(f"{user_query}\x1f{version}".encode()).hexdigest()[:16]
+        with self._threads_lock:
+            if thread_id in self._active_threads:
+                if explicit:
+                    raise RuntimeError(f"Checkpoint thread '{thread_id}' is already running.")
+                # Same question asked concurrently: this run gets a private thread of its own.
+                thread_id = f"{thread_id}-{uuid.uuid4().hex[:8]}"
+            self._active_threads.add(thread_id)
+        try:
+            run_config = {"configurable": {"thread_id": thread_id}}
+            snapshot = self.durable_app.get_state(run_config)
+            if snapshot.next:
+                print(f"[INFO] Resuming thread {thread_id} before node(s): {list(snapshot.next)}")
+                yield self.durable_app, None, run_config
+            else:
+                yield self.durable_app, fresh, run_config
+        finally:
+            with self._threads_lock:
+                self._active_threads.discard(thread_id)
+
+    def lookup_cache(self, user_query: str, use_cache: bool = True):
+        """Return the cached answer for the query, or None on a miss or bypass."""
+        if self.cache is None or not use_cache:
+            return None
+        answer = self.cache.get(user_query)
+        if answer is not None:
+            print("[INFO] Answer served from cache.")
+        return answer
+
+    def _store(self, user_query: str, answer: Dict[str, Any], use_cache: bool) -> None:
+        if self.cache is not None and use_cache:
+            self.cache.put(user_query, answer)
+
+    def run(
+        self,
+        user_query: str,
+        use_cache: bool = True,
+        thread_id: Optional[str] = None,
+        deadline_s: Optional[float] = None,
+    ):
+        """
+        Answer the query; `use_cache=False` bypasses the answer cache for this request.
+        With checkpointing enabled, an interrupted run on the same `thread_id` is resumed.
+        Every LLM and MCP call shares the `deadline_s` budget (default: resilience.query_deadline_s).
+        """
+        cached = self.lookup_cache(user_query, use_cache)
+        if cached is not None:
+            return cached
         print("\nSTARTING GRAPH EXECUTION\n")
-        result = self.app.invoke({"query": user_query, "loop_count": 0, "last_node": None})        
-        return result["final_output"].model_dump()
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Government Budget Supervisor Pipeline")
-    parser.add_argument("--config", type=str, default="config.yaml", help="Path to YAML config file.")
-    parser.add_argument("--query", type=str, required=True, help="User query to analyze.")
-    args = parser.parse_args()
-
+        with self._run_scope(deadline_s), self._prepare_run(user_query, thread_id) as (app, inputs, run_config):
+            result = app.invoke(inputs, run_config)
+        answer = result["final_output"].model_dump()
+        # Answers cut short by the deadline are returned but not cached.
+        self._store(user_query, answer, use_cache and not result.get("degraded"))
+        return answer
+
+    async def arun(
+        self,
+        user_query: str,
+        use_cache: bool = True,
+        deadline_s: Optional[float] = None,
+        cache_checked: bool = False,
+    ):
+        """
+        Async variant of run(), used by the long-lived service (not checkpointed).
+        `cache_checked=True` skips the cache lookup when the caller has already missed.
+        Cache reads and writes hash the document and touch SQLite, so they run off the event loop.
+        """
+        if not cache_checked:
+            cached = await asyncio.to_thread(self.lookup_cache, user_query, use_cache)
+            if cached is not None:
+                return cached
+        with self._run_scope(deadline_s):
+            result = await self.app.ainvoke({"query": user_query, "loop_count": 0, "last_node": None})
+        answer = result["final_output"].model_dump()
+        await asyncio.to_thread(self._store, user_query, answer, use_cache and not result.get("degraded"))
+        return answer
+
+    def _to_events(self, mode: str, chunk: Any) -> List[Dict[str, Any]]:
+        """Translate a LangGraph stream chunk into pipeline events."""
+        if mode == "custom":
+            return [chunk]
+        events = []
+        for node, update in (chunk or {}).items():
+            update = update or {}
+            if node == "revenue_node" and update.get("revenue"):
+                events.append({"event": "finding", "domain": "revenue", "content": update["revenue"]})
+            if node == "expenditure_node" and update.get("expenditure"):
+                events.append({"event": "finding", "domain": "expenditure", "content": update["expenditure"]})
+            events.append({"event": "node_end", "node": node})
+            if update.get("final_output") is not None:
+                events.append({
+                    "event": "final",
+                    "output": update["final_output"].model_dump(),
+                    "degraded": bool(update.get("degraded")),
+                })
+        return events
+
+    def _cached_events(self, answer: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [
+            {"event": "answer_token", "content": answer.get("direct_answer", "")},
+            {"event": "final", "output": answer, "cached": True},
+        ]
+
+    def stream(
+        self,
+        user_query: str,
+        use_cache: bool = True,
+        thread_id: Optional[str] = None,
+        deadline_s: Optional[float] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Run the graph and yield events as they happen:
+        node_start/node_end, route, tool_call/tool_result, finding,
+        answer_token (reviewer output token by token) and finally `final`.
+        """
+        cached = self.lookup_cache(user_query, use_cache)
+        if cached is not None:
+            yield from self._cached_events(cached)
+            return
+        with self._run_scope(deadline_s), self._prepare_run(user_query, thread_id) as (app, inputs, run_config):
+            for mode, chunk in app.stream(inputs, run_config, stream_mode=["custom", "updates"]):
+                for event in self._to_events(mode, chunk):
+                    if event["event"] == "final":
+                        self._store(user_query, event["output"], use_cache and not event["degraded"])
+                    yield event
+
+    async def astream(
+        self, user_query: str, use_cache: bool = True, deadline_s: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Async variant of stream() for embedding in an event loop (not checkpointed)."""
+        cached = self.lookup_cache(user_query, use_cache)
+        if cached is not None:
+            for event in self._cached_events(cached):
+                yield event
+            return
+        inputs = {"query": user_query, "loop_count": 0, "last_node": None}
+        with self._run_scope(deadline_s):
+            async for mode, chunk in self.app.astream(inputs, stream_mode=["custom", "updates"]):
+                for event in self._to_events(mode, chunk):
+                    if event["event"] == "final":
+                        self._store(user_query, event["output"], use_cache and not event["degraded"])
+                    yield event
+
+
+def print_event(event: Dict[str, Any]) -> None:
+    """Render a stream() event on the console."""
+    kind = event["event"]
+    if kind == "answer_token":
+        print(event["content"], end="", flush=True)
+    elif kind == "node_start":
+        print(f"[START] {event['node']}", flush=True)
+    elif kind == "node_end":
+        print(f"[END] {event['node']}", flush=True)
+    elif kind == "route":
+        print(f"[ROUTE] {event['next']}: {event['reasoning']}", flush=True)
+    elif kind == "tool_call":
+        print(f"[TOOL] {event['node']} -> {event['tool']}({event['args']})", flush=True)
+    elif kind == "tool_result":
+        print(f"[TOOL RESULT] {event['tool']}: {event['content'][:200]}", flush=True)
+    elif kind == "finding":
+        print(f"[FINDING:{event['domain']}] {event['content']}", flush=True)
+    elif kind == "final":
+        print("\n")
+
+def main(argv: Optional[List[str]] = None):
+    args = qa_parser().parse_args(argv)
+    load_dotenv()
+    if args.profile:
+        enable_profiling(args.profile)
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        configure_model_provider(yaml.safe_load(f))
     config = load_config(args.config)
     pipeline = BudgetSupervisorPipeline(config)
-    result = pipeline.run(args.query)
-    print("Final Result: ", result["direct_answer"])
\ No newline at end of file
+    if args.stream:
+        for event in pipeline.stream(args.query, use_cache=not args.no_cache, thread_id=args.thread_id, deadline_s=args.deadline):
+            print_event(event)
+    else:
+        result = pipeline.run(args.query, use_cache=not args.no_cache, thread_id=args.thread_id, deadline_s=args.deadline)
+        print("Final Result: ", result["direct_answer"])
+    print(f"[INFO] Model scheduler metrics: {get_model_provider().metrics()}")
+
+
+if __name__ == "__main__":
+    main()
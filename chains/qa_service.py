@@ -0,0 +1,244 @@
+import warnings
+warnings.filterwarnings("ignore")
+
+import json
+import time
+import yaml
+import asyncio
+import contextlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from utils.model import ServiceConfigModel, Part3ConfigModel
+from utils.prompts import FIELD_EXTRACTION_PROMPT
+from utils.model_provider import configure_model_provider, get_model_provider
+from utils.profiling import enable_profiling
+from chains.cli import serve_parser
+
+from dotenv import load_dotenv
+
+
+class ServiceUnavailable(Exception):
+    """Raised when a request cannot be queued (queue full or shutting down)."""
+
+
+class BadRequest(Exception):
+    """Raised when a request payload is invalid."""
+
+
+class QAService:
+    """
+    Keeps one BudgetSupervisorPipeline and one FieldExtractionChain warm and
+    executes requests against them with bounded concurrency, a bounded wait
+    queue and a per-request deadline.
+
+    `pipeline` needs an async `arun(query, use_cache, deadline_s, cache_checked)` and
+    optionally `lookup_cache(query, use_cache)`; `extractor` needs
+    `run(structured_text, target_pages, prompt_template)`. Both can be stubs,
+    which keeps the service testable without network access.
+    """
+
+    def __init__(
+        self,
+        pipeline: Any,
+        extractor: Any,
+        structured_text: Dict[str, Any],
+        config: ServiceConfigModel,
+        default_pages: List[int],
+    ):
+        self.pipeline = pipeline
+        self.extractor = extractor
+        self.structured_text = structured_text
+        self.config = config
+        self.default_pages = default_pages
+
+        self._slots = asyncio.Semaphore(config.max_concurrency)
+        self._waiting = 0
+        self._in_flight = 0
+        self._draining = False
+        self._started = time.time()
+        self._stats = {"completed": 0, "failed": 0, "timeouts": 0, "rejected": 0, "cache_hits": 0, "total_latency_s": 0.0}
+
+    async def _queued(self, work: Callable[[], Awaitable[Any]]) -> Any:
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+        try:
+            return await work()
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+
+    async def execute(self, work: Callable[[], Awaitable[Any]]) -> Any:
+        """Queue `work`, enforcing the queue bound and the request deadline."""
+        if self._draining or self._waiting >= self.config.max_queue:
+            self._stats["rejected"] += 1
+            raise ServiceUnavailable("shutting down" if self._draining else "request queue is full")
+
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(self._queued(work), timeout=self.config.request_timeout_s)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+        self._stats["completed"] += 1
+        self._stats["total_latency_s"] += time.monotonic() - start
+        return result
+
+    async def query(self, user_query: str, use_cache: bool = True) -> Dict[str, Any]:
+        # Cache hits skip the queue so repeat questions are not stuck behind slow ones.
+        lookup = getattr(self.pipeline, "lookup_cache", None)
+        # Hashing the document and reading SQLite block, so keep them off the event loop.
+        cached = await asyncio.to_thread(lookup, user_query, use_cache) if lookup else None
+        if cached is not None:
+            self._stats["cache_hits"] += 1
+            return cached
+        # The pipeline's deadline is whatever is left of the request timeout once it leaves the queue.
+        start = time.monotonic()
+        return await self.execute(
+            lambda: self.pipeline.arun(
+                user_query,
+                use_cache=use_cache,
+                deadline_s=max(0.001, self.config.request_timeout_s - (time.monotonic() - start)),
+                cache_checked=lookup is not None,
+            )
+        )
+
+    async def extract(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if payload.get("text"):
+            structured_text = {"elements": [{"page": 0, "content_markdown": payload["text"]}]}
+            pages = [0]
+        else:
+            structured_text = self.structured_text
+            pages = payload.get("target_pages") or self.default_pages
+            if not isinstance(pages, list) or not all(isinstance(p, int) for p in pages):
+                raise BadRequest("'target_pages' must be a list of page numbers")
+        return await self.execute(
+            lambda: asyncio.to_thread(self.extractor.run, structured_text, pages, FIELD_EXTRACTION_PROMPT)
+        )
+
+    def metrics(self) -> Dict[str, Any]:
+        completed = self._stats["completed"]
+        return {
+            "uptime_s": round(time.time() - self._started, 1),
+            "in_flight": self._in_flight,
+            "queued": self._waiting,
+            "draining": self._draining,
+            **{k: v for k, v in self._stats.items() if k != "total_latency_s"},
+            "avg_latency_s": round(self._stats["total_latency_s"] / completed, 3) if completed else 0.0,
+        }
+
+    async def drain(self) -> None:
+        """Stop accepting work and wait (up to the grace period) for in-flight requests."""
+        self._draining = True
+        deadline = time.monotonic() + self.config.shutdown_grace_s
+        while (self._in_flight or self._waiting) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._in_flight or self._waiting:
+            print(f"[WARN] Shutdown grace period elapsed with {self._in_flight + self._waiting} request(s) unfinished.")
+
+
+def create_app(service: QAService) -> Starlette:
+    """Build the ASGI app exposing /query, /extract, /health and /metrics."""
+
+    async def _handle(request: Request, handler: Callable[[Dict[str, Any]], Awaitable[Any]]) -> JSONResponse:
+        try:
+            payload = await request.json()
+        except json.JSONDecodeError:
+            return JSONResponse({"error": "request body must be JSON"}, status_code=400)
+        if not isinstance(payload, dict):
+            return JSONResponse({"error": "request body must be a JSON object"}, status_code=400)
+        try:
+            return JSONResponse({"result": await handler(payload)})
+        except BadRequest as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        except ServiceUnavailable as e:
+            return JSONResponse({"error": str(e)}, status_code=503)
+        except asyncio.TimeoutError:
+            return JSONResponse({"error": "request timed out"}, status_code=504)
+        except Exception as e:
+            print(f"[ERROR] Request failed: {e}")
+            return JSONResponse({"error": str(e)}, status_code=500)
+
+    async def query_endpoint(request: Request) -> JSONResponse:
+        async def handler(payload):
+            if not payload.get("query") or not isinstance(payload["query"], str):
+                raise BadRequest("missing 'query'")
+            return await service.query(payload["query"], use_cache=not payload.get("no_cache", False))
+        return await _handle(request, handler)
+
+    async def extract_endpoint(request: Request) -> JSONResponse:
+        return await _handle(request, service.extract)
+
+    async def health_endpoint(request: Request) -> JSONResponse:
+        status = "draining" if service.metrics()["draining"] else "ok"
+        return JSONResponse({"status": status}, status_code=503 if status == "draining" else 200)
+
+    async def metrics_endpoint(request: Request) -> JSONResponse:
+        return JSONResponse({"service": service.metrics(), "model_scheduler": get_model_provider().metrics()})
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        yield
+        await service.drain()
+
+    return Starlette(
+        routes=[
+            Route("/query", query_endpoint, methods=["POST"]),
+            Route("/extract", extract_endpoint, methods=["POST"]),
+            Route("/health", health_endpoint, methods=["GET"]),
+            Route("/metrics", metrics_endpoint, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    args = serve_parser().parse_args(argv)
+    load_dotenv()
+    if args.profile:
+        enable_profiling(args.profile)
+
+    from chains.qa_chain import BudgetSupervisorPipeline, load_config
+    from chains.field_extraction_chain import FieldExtractionChain
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    configure_model_provider(cfg)
+    service_config = ServiceConfigModel(**(cfg.get("service") or {}))
+    qa_config: Part3ConfigModel = load_config(args.config)
+
+    with open(qa_config.extracted_text_path, "r", encoding="utf-8") as f:
+        structured_text = json.load(f)
+
+    # Built once: imports, config validation, graph compilation and client setup
+    # are paid at startup instead of per request.
+    service = QAService(
+        pipeline=BudgetSupervisorPipeline(qa_config),
+        extractor=FieldExtractionChain(model=qa_config.model_name),
+        structured_text=structured_text,
+        config=service_config,
+        default_pages=cfg.get("target_pages_part_1", []),
+    )
+
+    uvicorn.run(
+        create_app(service),
+        host=args.host or service_config.host,
+        port=args.port or service_config.port,
+        timeout_graceful_shutdown=int(service_config.shutdown_grace_s),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,72 @@
 import time
 import json
+import sys
+import queue
+import itertools
+import threading
 import subprocess
-from typing import Any, Dict, Optional
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from utils.deadline import DeadlineExceeded, current_deadline
+
+HTTP_PROTOCOL_VERSION = "2025-03-26"
+
+
+class MCPSessionExpired(Exception):
+    """The shared server no longer knows our session (e.g. it was restarted)."""
+
 
 class MCPClient:
-    """Handles JSON-RPC communication with the FastMCP server."""
+    """
+    Handles JSON-RPC communication with the FastMCP server.
+    `server_path` is either a server script, started as a stdio child for each
+    call, or the URL of a shared server running with `--transport http`, which
+    is reached over one persistent streamable HTTP session.
+    """
 
-    def __init__(self, server_path: str):
+    def __init__(self, server_path: str, timeout: float = 3.0):
         self.server_path = server_path
+        self.timeout = timeout
+        self.is_remote = server_path.startswith(("http://", "https://"))
+        self._http = None
+        self._session_id: Optional[str] = None
+        self._ids = itertools.count(1)
+        self._session_lock = threading.Lock()
+
+    def _timeout(self) -> float:
+        """Per-message timeout, capped by the remaining query deadline."""
+        deadline = current_deadline()
+        if deadline is None:
+            return self.timeout
+        deadline.check("MCP call")
+        return min(self.timeout, deadline.remaining())
+
+    @staticmethod
+    def _pump(stream, put: Callable[[Optional[str]], None]) -> None:
+        """Reader thread: pass lines from a child's pipe to `put`, then None at EOF."""
+        for line in iter(stream.readline, ""):
+            put(line)
+        put(None)
 
-    def _read_until_result(self, proc, target_id: int, timeout=3.0):
-        start = time.time()
+    def _read_until_result(self, lines: "queue.Queue[Optional[str]]", target_id: int, timeout: Optional[float] = None, stderr: Optional[Deque[str]] = None):
+        # Lines arrive through a reader thread, so the wait is bounded by `timeout`
+        # even when the server never writes anything.
+        timeout = self._timeout() if timeout is None else timeout
+        end = time.monotonic() + timeout
         buffer = ""
-        while time.time() - start < timeout:
-            line = proc.stdout.readline()
-            if not line:
-                time.sleep(0.05)
-                continue
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                line = lines.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if line is None:
+                raise ConnectionError(
+                    f"MCP server exited before responding.\nstderr:\n{''.join(l for l in stderr or [] if l)}"
+                )
             buffer += line
             try:
                 msg = json.loads(line)
@@ -24,8 +74,140 @@ class MCPClient:
                     return msg
             except json.JSONDecodeError:
                 continue
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired():
+            raise DeadlineExceeded("Query deadline exceeded waiting for MCP response.")
         raise TimeoutError(f"Timed out waiting for MCP response.\nPartial buffer:\n{buffer}")
 
+    # === Streamable HTTP transport ===
+
+    def _post(self, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        import httpx
+
+        if self._http is None:
+            self._http = httpx.Client()
+        headers = {"Accept": "application/json, text/event-stream", "Content-Type": "application/json"}
+        if self._session_id:
+            headers["mcp-session-id"] = self._session_id
+            headers["mcp-protocol-version"] = HTTP_PROTOCOL_VERSION
+        try:
+            resp = self._http.post(self.server_path, json=message, headers=headers, timeout=self._timeout())
+        except httpx.TimeoutException as e:
+            deadline = current_deadline()
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded("Query deadline exceeded waiting for MCP response.") from e
+            raise TimeoutError(f"Timed out waiting for MCP response from {self.server_path}") from e
+        if resp.status_code == 404 and self._session_id:
+            raise MCPSessionExpired()
+        resp.raise_for_status()
+        if resp.headers.get("mcp-session-id"):
+            self._session_id = resp.headers["mcp-session-id"]
+        if "id" not in message:
+            return None  # notification: the server answers 202 with no body
+
+        if resp.headers.get("content-type", "").startswith("text/event-stream"):
+            # The response is sent as an SSE stream; pick the event answering our request.
+            for line in resp.text.splitlines():
+                if line.startswith("data:"):
+                    try:
+                        msg = json.loads(line[5:].strip())
+                    except json.JSONDecodeError:
+                        continue
+                    if msg.get("id") == message["id"]:
+                        return msg
+            raise TimeoutError(f"MCP server closed the stream without a response.\nPartial buffer:\n{resp.text}")
+        return resp.json()
+
+    def _ensure_session(self) -> None:
+        with self._session_lock:
+            if self._session_id is not None:
+                return
+            self._post({
+                "jsonrpc": "2.0",
+                "id": 0,
+                "method": "initialize",
+                "params": {
+                    "protocolVersion": HTTP_PROTOCOL_VERSION,
+                    "capabilities": {},
+                    "clientInfo": {"name": "LangGraphBudgetPipeline", "version": "0.1"},
+                },
+            })
+            self._post({"jsonrpc": "2.0", "method": "notifications/initialized"})
+
+    def _call_remote(self, method_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        request = {
+            "jsonrpc": "2.0",
+            "id": next(self._ids),
+            "method": "tools/call",
+            "params": {"name": method_name, "arguments": arguments},
+        }
+        self._ensure_session()
+        try:
+            return self._post(request)
+        except MCPSessionExpired:
+            # The shared server was restarted: open a new session and retry once.
+            with self._session_lock:
+                self._session_id = None
+            self._ensure_session()
+            return self._post(request)
+
+    def close(self) -> None:
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+        self._session_id = None
+
+    # === Stdio transport ===
+
+    def _call_stdio(self, method_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        proc = subprocess.Popen(
+            [sys.executable, self.server_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+        lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        # Keep the tail of stderr for error messages; draining it also stops a chatty server from blocking.
+        stderr: Deque[str] = deque(maxlen=50)
+        for stream, put in ((proc.stdout, lines.put), (proc.stderr, stderr.append)):
+            threading.Thread(target=self._pump, args=(stream, put), daemon=True).start()
+
+        try:
+            # === Handshake ===
+            init_request = {
+                "jsonrpc": "2.0",
+                "id": 0,
+                "method": "initialize",
+                "params": {
+                    "protocolVersion": "2024-11-05",
+                    "capabilities": {},
+                    "clientInfo": {"name": "LangGraphBudgetPipeline", "version": "0.1"},
+                },
+            }
+            proc.stdin.write(json.dumps(init_request) + "\n")
+            proc.stdin.flush()
+            self._read_until_result(lines, 0, stderr=stderr)
+
+            # === Call tool ===
+            call_request = {
+                "jsonrpc": "2.0",
+                "id": 1,
+                "method": "tools/call",
+                "params": {"name": method_name, "arguments": arguments},
+            }
+            proc.stdin.write(json.dumps(call_request) + "\n")
+            proc.stdin.flush()
+            return self._read_until_result(lines, 1, stderr=stderr)
+        finally:
+            # Also reached on timeout/deadline, so abandoned servers do not linger.
+            proc.terminate()
+            try:
+                proc.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
     def call(
         self,
         method_name_or_arg: Any,
@@ -39,46 +221,11 @@ class MCPClient:
         else:
             method_name = method_name_or_arg
 
-        proc = subprocess.Popen(
-            ["python", self.server_path],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-        )
-
-        # === Handshake ===
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": 0,
-            "method": "initialize",
-            "params": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {},
-                "clientInfo": {"name": "LangGraphBudgetPipeline", "version": "0.1"},
-            },
-        }
-        proc.stdin.write(json.dumps(init_request) + "\n")
-        proc.stdin.flush()
-        self._read_until_result(proc, 0)
-
-        # === Call tool ===
-        call_request = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "tools/call",
-            "params": {"name": method_name, "arguments": arguments},
-        }
-        proc.stdin.write(json.dumps(call_request) + "\n")
-        proc.stdin.flush()
-        response = self._read_until_result(proc, 1)
-
-        proc.terminate()
-        try:
-            proc.wait(timeout=1)
-        except subprocess.TimeoutExpired:
-            proc.kill()
+        self._timeout()  # fail fast if the query deadline has already passed
+        if self.is_remote:
+            response = self._call_remote(method_name, arguments)
+        else:
+            response = self._call_stdio(method_name, arguments)
 
         result = response.get("result", {})
         content = result.get("content", [])
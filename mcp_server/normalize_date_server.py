@@ -1,10 +1,21 @@
 from fastmcp import FastMCP
 from datetime import datetime
+from typing import List, Optional
+import argparse
+import signal
+import sys
+import os
 import re
 
+if not __package__:
+    # Started as a script (stdio child of MCPClient): make the repo's utils importable.
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.profiling import enable_profiling, profiled
+
 app = FastMCP("normalize-date-server")
 
 @app.tool("normalize_date")
+@profiled("normalize_date", allocations=False)
 def normalize_date(date_string: str) -> str:
     """
     Normalize budget-style dates to ISO YYYY-MM-DD.
@@ -30,5 +41,23 @@ def normalize_date(date_string: str) -> str:
                 continue
     return ""
 
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="MCP server for normalizing budget dates")
+    parser.add_argument("--transport", choices=["stdio", "http", "sse"], default="stdio", help="stdio child per client (default), or a shared streamable HTTP / SSE server.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Interface to bind for http/sse.")
+    parser.add_argument("--port", type=int, default=8766, help="Port to listen on for http/sse.")
+    parser.add_argument("--profile", type=str, default=None, metavar="DIR", help="Write per-stage CPU and allocation profiles to DIR.")
+    args = parser.parse_args(argv)
+
+    # Exit through atexit on SIGTERM, so the profile report is still written.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if args.profile:
+        enable_profiling(args.profile)
+
+    if args.transport == "stdio":
+        app.run()
+    else:
+        app.run(transport=args.transport, host=args.host, port=args.port)
+
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    main()
@@ -1,31 +1,221 @@
+import os
 import re
-from typing import List, Dict, Any
+import sys
+import json
+import atexit
+import signal
+import asyncio
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import List, Dict, Any, Optional, Tuple
 
-    
 from fastmcp import FastMCP
-import re
-import json
-from typing import List, Dict, Any
+
+if not __package__:
+    # Started as a script (stdio child of MCPClient): make the repo's utils importable.
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.profiling import enable_profiling, profile_stage, profiled
 
 app = FastMCP("search-budget-server")
 
+MANIFEST_NAME = "manifest.json"
+
+# Parsed shards kept per process (the server and each search worker), keyed by path and mtime.
+_shard_cache: Dict[str, Tuple[int, List[Dict[str, Any]]]] = {}
+_cache_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+# Corpus shards are searched in a process pool only by a long-lived http/sse server.
+# A stdio server lives for one call, so spawning workers would cost more than the search.
+_use_pool = False
+# Corpus directories whose shards every search worker loads when it starts (--preload).
+_preload_dirs: List[str] = []
+# Searches running at once; the rest wait. Only matters when many clients share one server.
+_search_slots = asyncio.Semaphore(int(os.getenv("SEARCH_MAX_CONCURRENCY", 8)))
+
+
+def _load_elements(path: str) -> List[Dict[str, Any]]:
+    mtime = os.stat(path).st_mtime_ns
+    cached = _shard_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        # Concurrent searches on a shared server must not parse the same file twice.
+        with _cache_lock:
+            cached = _shard_cache.get(path)
+            if cached is None or cached[0] != mtime:
+                with profile_stage("search.load"), open(path, "r", encoding="utf-8") as f:
+                    cached = (mtime, json.load(f).get("elements", []))
+                _shard_cache[path] = cached
+    return cached[1]
+
+
+def _warm_cache(paths: List[str]) -> int:
+    """Load JSON files, or every shard of corpus directories, into this process's cache."""
+    loaded = 0
+    for path in paths:
+        if os.path.isdir(path):
+            loaded += sum(len(_load_elements(shard)) for shard in _select_shards(path, None, None))
+        else:
+            loaded += len(_load_elements(path))
+    return loaded
+
+
+def _matches(el: Dict[str, Any], doc_ids: Optional[List[str]], years: Optional[List[int]]) -> bool:
+    if doc_ids and el.get("doc_id") not in doc_ids:
+        return False
+    if years and el.get("year") not in years:
+        return False
+    return True
+
+
+def _search_shard(
+    path: str,
+    keyword: str,
+    doc_ids: Optional[List[str]] = None,
+    years: Optional[List[int]] = None,
+) -> List[Dict[str, Any]]:
+    """Search one shard; runs in a worker process for corpus searches on a shared server."""
+    pattern = re.compile(keyword, re.IGNORECASE)
+    results = []
+    for el in _load_elements(path):
+        if not _matches(el, doc_ids, years):
+            continue
+        text = el.get("content_markdown", "")
+        hits = len(pattern.findall(text))
+        if hits:
+            results.append({
+                "doc_id": el.get("doc_id"),
+                "year": el.get("year"),
+                "page": el.get("page"),
+                "text": text.strip(),
+                "score": hits,
+            })
+    return results
+
+
+def _worker_count() -> int:
+    return int(os.getenv("SEARCH_WORKERS", min(4, os.cpu_count() or 1)))
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        atexit.register(_shutdown_pool)
+        # Spawned, not forked: the pool is created from a worker thread while other threads
+        # (the server's event loop, a concurrent shard load) may hold locks a fork would copy.
+        _pool = ProcessPoolExecutor(
+            max_workers=_worker_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_cache,
+            initargs=(list(_preload_dirs),),
+        )
+    return _pool
+
+
+def _shutdown_pool() -> None:
+    """Stop the search workers; otherwise they outlive the server as orphans."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+def _exit_on_sigterm(signum, frame) -> None:
+    # Default SIGTERM handling skips atexit, which would leave the pool running.
+    sys.exit(0)
+
+
+def _select_shards(corpus_dir: str, doc_ids: Optional[List[str]], years: Optional[List[int]]) -> List[str]:
+    """Use the manifest to skip shards that cannot match the filters."""
+    with open(os.path.join(corpus_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return [
+        os.path.join(corpus_dir, shard["path"])
+        for shard in manifest.get("shards", [])
+        if _matches(shard, doc_ids, years)
+    ]
+
+
+@profiled("search")
+def _search(
+    keyword: str,
+    structured_json_path: str,
+    doc_ids: Optional[List[str]],
+    years: Optional[List[int]],
+) -> List[Dict[str, Any]]:
+    if os.path.isdir(structured_json_path):
+        shards = _select_shards(structured_json_path, doc_ids, years)
+        if not _use_pool or len(shards) <= 1:
+            per_shard = [_search_shard(p, keyword, doc_ids, years) for p in shards]
+        else:
+            per_shard = list(_get_pool().map(
+                _search_shard, shards, [keyword] * len(shards), [doc_ids] * len(shards), [years] * len(shards)
+            ))
+        results = [r for shard_results in per_shard for r in shard_results]
+    else:
+        results = _search_shard(structured_json_path, keyword, doc_ids, years)
+
+    results.sort(key=lambda r: (-r["score"], str(r["doc_id"]), r["page"] or 0))
+    return results
+
+
 @app.tool("search_budget_text")
-def search_budget_text(keyword: str, structured_json_path: str) -> List[Dict[str, Any]]:
+async def search_budget_text(
+    keyword: str,
+    structured_json_path: str,
+    doc_ids: Optional[List[str]] = None,
+    years: Optional[List[int]] = None,
+) -> List[Dict[str, Any]]:
     """
     Search parsed budget text JSON for a given keyword (one word). Keyword example is revenue, expenditure, spending etc.
     Args:
         keyword (str): Keyword to search.
-        structured_json_path (str): Path to JSON containing budget elements.
+        structured_json_path (str): Path to JSON containing budget elements, or to a sharded corpus directory.
+        doc_ids (list[str], optional): Only search these documents.
+        years (list[int], optional): Only search documents from these fiscal years.
+    Results are ranked by number of keyword matches.
     """
-    with open(structured_json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    elements = data.get("elements", [])
-    results = []
-    for c in elements:
-        text = c.get("content_markdown", "")
-        if re.search(keyword, text, re.IGNORECASE):
-            results.append({"page": c.get("page"), "text": text.strip()})
-    return results
+    async with _search_slots:
+        # Off the event loop, so other clients' requests keep being accepted meanwhile.
+        return await asyncio.to_thread(_search, keyword, structured_json_path, doc_ids, years)
+
+
+def main(argv: Optional[List[str]] = None):
+    global _search_slots, _use_pool
+    parser = argparse.ArgumentParser(description="MCP server for searching parsed budget text")
+    parser.add_argument("--transport", choices=["stdio", "http", "sse"], default="stdio", help="stdio child per client (default), or a shared streamable HTTP / SSE server.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Interface to bind for http/sse.")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on for http/sse.")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="Searches run at once (defaults to SEARCH_MAX_CONCURRENCY or 8).")
+    parser.add_argument("--preload", action="append", default=[], help="JSON file or corpus directory to load before serving; repeatable.")
+    parser.add_argument("--profile", type=str, default=None, metavar="DIR", help="Write per-stage CPU and allocation profiles to DIR.")
+    args = parser.parse_args(argv)
+
+    _use_pool = args.transport != "stdio"
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    if args.profile:
+        enable_profiling(args.profile)
+    if args.max_concurrency:
+        _search_slots = asyncio.Semaphore(args.max_concurrency)
+
+    if args.preload:
+        paths = [os.path.abspath(p) for p in args.preload]
+        _preload_dirs.extend(p for p in paths if os.path.isdir(p))
+        loaded = _warm_cache([p for p in paths if not os.path.isdir(p)])
+        if not _use_pool:
+            loaded += _warm_cache(_preload_dirs)
+        elif _preload_dirs:
+            # Start every worker now so their initializers load the shards before the first query.
+            pool = _get_pool()
+            wait([pool.submit(os.getpid) for _ in range(_worker_count())])
+        # stdout carries the protocol in stdio mode, so log to stderr.
+        print(f"[INFO] Preloaded {loaded} element(s) and {len(_preload_dirs)} corpus dir(s)", file=sys.stderr)
+
+    if args.transport == "stdio":
+        app.run()
+    else:
+        app.run(transport=args.transport, host=args.host, port=args.port)
+
 
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    main()
@@ -0,0 +1,38 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.profiling import Profiler
+
+
+def _summary(profiler, stage):
+    profiler.report()
+    with open(os.path.join(profiler.output_dir, "summary.json"), encoding="utf-8") as f:
+        return json.load(f)[stage]
+
+
+def test_waits_inside_a_stage_are_sampled(tmp_path):
+    profiler = Profiler(str(tmp_path))
+    cond = threading.Condition()
+    # A wait on a condition, as in the model rate limiter, is stage time and must be sampled.
+    with profiler.stage("qa.supervisor", allocations=False):
+        with cond:
+            cond.wait(timeout=0.5)
+    row = _summary(profiler, "qa.supervisor")
+    assert row["wall_clock_samples"] > 0
+    with open(tmp_path / "qa.supervisor.collapsed", encoding="utf-8") as f:
+        assert "wait (threading.py" in f.read()
+
+
+def test_idle_pool_workers_are_not_sampled(tmp_path):
+    profiler = Profiler(str(tmp_path))
+    with ThreadPoolExecutor(2) as pool:
+        list(pool.map(abs, [1, 2]))
+        with profiler.stage("work", allocations=False):
+            time.sleep(0.3)
+    row = _summary(profiler, "work")
+    assert row["idle_thread_samples"] > 0
+    with open(tmp_path / "work.collapsed", encoding="utf-8") as f:
+        assert "_worker (thread.py" not in f.read()
@@ -0,0 +1,90 @@
+import json
+from typing import Any, List
+
+import pytest
+
+pytest.importorskip("langchain")
+pytest.importorskip("langgraph")
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+import chains.qa_chain as qa_chain
+from utils.model import AnswerCacheConfig, CheckpointConfig, Part3ConfigModel
+
+PAGES = {page: f"Page {page} revenue text" for page in range(1, 5)}
+# Two keywords whose hits overlap on pages 2 and 3.
+HITS = {
+    "revenue": [{"doc_id": "budget", "page": p, "text": PAGES[p], "score": 1} for p in (1, 2, 3)],
+    "tax": [{"doc_id": "budget", "page": p, "text": PAGES[p], "score": 1} for p in (2, 3, 4)],
+}
+
+
+class ParallelSearchModel(BaseChatModel):
+    """Always asks for two parallel searches; its structured output echoes the prompt."""
+
+    parser_prompts: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "parallel-search-stub"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        calls = [
+            {"name": "search_budget_text", "args": {"keyword": keyword}, "id": f"call_{keyword}"}
+            for keyword in HITS
+        ]
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="", tool_calls=calls))])
+
+    def bind_tools(self, tools, **kwargs: Any):
+        return self
+
+    def with_structured_output(self, schema, **kwargs: Any):
+        def parse(prompt):
+            self.parser_prompts.append(str(prompt))
+            return schema(**{field: str(prompt) for field in schema.model_fields})
+        return RunnableLambda(parse)
+
+
+class StubProvider:
+    def __init__(self, model):
+        self.model = model
+
+    def chat_model(self, **kwargs: Any):
+        return self.model
+
+
+class StubMCPClient:
+    def __init__(self, server_path: str, timeout: float = 3.0):
+        self.server_path = server_path
+
+    def call(self, method: str, arguments: Any) -> str:
+        return json.dumps(HITS[arguments["keyword"]])
+
+
+def test_parallel_overlapping_searches_keep_page_text(tmp_path, monkeypatch):
+    extracted = tmp_path / "extracted_text.json"
+    extracted.write_text(json.dumps({"elements": []}))
+    model = ParallelSearchModel()
+    monkeypatch.setattr(qa_chain, "get_model_provider", lambda: StubProvider(model))
+    monkeypatch.setattr(qa_chain, "MCPClient", StubMCPClient)
+    config = Part3ConfigModel(
+        extracted_text_path=str(extracted),
+        answer_cache=AnswerCacheConfig(enabled=False),
+        checkpoint=CheckpointConfig(enabled=False),
+    )
+    pipeline = qa_chain.BudgetSupervisorPipeline(config)
+    monkeypatch.setattr(pipeline, "_emit", lambda event, **payload: None)
+
+    # Inside a run scope, so both searches share the run's context budget and dedupe applies.
+    with pipeline._run_scope(None):
+        state = pipeline.node_revenue({"query": "What are the revenue streams?", "loop_count": 0})
+
+    prompt = model.parser_prompts[-1]
+    for text in PAGES.values():
+        assert text in prompt
+        assert text in state["revenue"]
+    # The overlapping pages appear as markers in one search result and in full in the other.
+    assert prompt.count("already returned by another search") == 2
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("starlette")
+pytest.importorskip("httpx")
+pytest.importorskip("langchain_google_genai")
+
+from starlette.testclient import TestClient
+
+from chains.qa_service import QAService, create_app
+from utils.model import ServiceConfigModel
+
+
+class StubPipeline:
+    def __init__(self, delay_s=0.0):
+        self.delay_s = delay_s
+        self.calls = []
+
+    def lookup_cache(self, query, use_cache=True):
+        return None
+
+    async def arun(self, query, use_cache=True, deadline_s=None, cache_checked=False):
+        self.calls.append({"query": query, "deadline_s": deadline_s, "cache_checked": cache_checked})
+        await asyncio.sleep(self.delay_s)
+        return {"direct_answer": f"answer to {query}"}
+
+
+class StubExtractor:
+    def run(self, structured_text, target_pages, prompt_template):
+        return {"pages": target_pages}
+
+
+def _service(pipeline=None, **config):
+    return QAService(
+        pipeline=pipeline or StubPipeline(),
+        extractor=StubExtractor(),
+        structured_text={"elements": []},
+        config=ServiceConfigModel(**config),
+        default_pages=[1, 2],
+    )
+
+
+def test_query_returns_answer():
+    pipeline = StubPipeline()
+    with TestClient(create_app(_service(pipeline))) as client:
+        response = client.post("/query", json={"query": "revenue?"})
+    assert response.status_code == 200
+    assert response.json() == {"result": {"direct_answer": "answer to revenue?"}}
+    # The service already missed the cache, so the pipeline must not look it up again.
+    assert pipeline.calls[0]["cache_checked"] is True
+    assert pipeline.calls[0]["deadline_s"] > 0
+
+
+def test_bad_requests_return_400():
+    with TestClient(create_app(_service())) as client:
+        assert client.post("/query", json=["not", "an", "object"]).status_code == 400
+        assert client.post("/query", json={"query": 42}).status_code == 400
+        assert client.post("/query", content=b"{not json").status_code == 400
+        assert client.post("/extract", json={"target_pages": "1,2"}).status_code == 400
+        assert client.post("/extract", json={"target_pages": [1, 2]}).json() == {"result": {"pages": [1, 2]}}
+
+
+def test_timeout_returns_504():
+    service = _service(StubPipeline(delay_s=1.0), request_timeout_s=0.1)
+    with TestClient(create_app(service)) as client:
+        response = client.post("/query", json={"query": "slow"})
+    assert response.status_code == 504
+    assert service.metrics()["timeouts"] == 1
+
+
+def test_full_queue_returns_503():
+    service = _service(max_queue=0)
+    with TestClient(create_app(service)) as client:
+        response = client.post("/query", json={"query": "revenue?"})
+    assert response.status_code == 503
+    assert service.metrics()["rejected"] == 1
+
+
+def test_draining_service_rejects_work():
+    service = _service()
+    with TestClient(create_app(service)) as client:
+        assert client.get("/health").status_code == 200
+        asyncio.run(service.drain())
+        assert client.get("/health").json() == {"status": "draining"}
+        assert client.get("/health").status_code == 503
+        assert client.post("/query", json={"query": "revenue?"}).status_code == 503
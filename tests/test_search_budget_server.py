@@ -0,0 +1,127 @@
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import subprocess
+
+import pytest
+
+pytest.importorskip("fastmcp")
+
+from mcp_client.mcp_client import MCPClient
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = os.path.join(REPO_ROOT, "mcp_server", "search_budget_server.py")
+
+
+def _write_corpus(corpus_dir, docs=3, shards_per_doc=3, pages_per_shard=2):
+    manifest = {"documents": [], "shards": []}
+    for d in range(docs):
+        doc_id, year = f"budget_{2022 + d}", 2022 + d
+        manifest["documents"].append({"doc_id": doc_id, "year": year, "pages": shards_per_doc * pages_per_shard})
+        for s in range(shards_per_doc):
+            elements = [
+                {
+                    "doc_id": doc_id,
+                    "year": year,
+                    "page": s * pages_per_shard + p + 1,
+                    "content_markdown": "Revenue " * (d + 1) + f"page {p}",
+                }
+                for p in range(pages_per_shard)
+            ]
+            name = f"{doc_id}-{s:03d}.json"
+            with open(os.path.join(corpus_dir, name), "w", encoding="utf-8") as f:
+                json.dump({"metadata": {"doc_id": doc_id, "year": year}, "elements": elements}, f)
+            manifest["shards"].append({"path": name, "doc_id": doc_id, "year": year, "elements": len(elements)})
+    with open(os.path.join(corpus_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+
+def _hits(result):
+    return json.loads(result) if isinstance(result, str) else result
+
+
+def _tagged_processes(tag):
+    """PIDs of live processes whose environment carries `tag` (the server and anything it started)."""
+    pids = []
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/environ", "rb") as f:
+                if f"SEARCH_TEST_TAG={tag}".encode() in f.read().split(b"\0"):
+                    pids.append(int(pid))
+        except OSError:
+            continue
+    return pids
+
+
+def _wait_gone(tag, timeout=10.0):
+    end = time.monotonic() + timeout
+    while _tagged_processes(tag) and time.monotonic() < end:
+        time.sleep(0.1)
+    return _tagged_processes(tag)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _port_open(port):
+    with socket.socket() as sock:
+        return sock.connect_ex(("127.0.0.1", port)) == 0
+
+
+needs_proc = pytest.mark.skipif(not os.path.isdir("/proc"), reason="process check reads /proc")
+
+
+@needs_proc
+def test_multi_shard_search_over_stdio(tmp_path, monkeypatch):
+    _write_corpus(str(tmp_path))
+    tag = uuid.uuid4().hex
+    monkeypatch.setenv("SEARCH_TEST_TAG", tag)
+    # Shards are searched in-process under stdio, so the default per-message timeout is enough.
+    client = MCPClient(SERVER)
+
+    hits = _hits(client.call("search_budget_text", {"keyword": "revenue", "structured_json_path": str(tmp_path)}))
+    assert len(hits) == 18
+    # Ranked by keyword count: the 2024 document repeats the keyword most.
+    assert hits[0]["doc_id"] == "budget_2024" and hits[0]["score"] == 3
+
+    filtered = _hits(client.call(
+        "search_budget_text",
+        {"keyword": "revenue", "structured_json_path": str(tmp_path), "years": [2022, 2023]},
+    ))
+    assert {h["doc_id"] for h in filtered} == {"budget_2022", "budget_2023"}
+    # Each stdio call's server must exit without leaving search workers behind.
+    assert _wait_gone(tag) == []
+
+
+@needs_proc
+def test_shared_http_server_shuts_down_its_workers(tmp_path):
+    _write_corpus(str(tmp_path))
+    tag, port = uuid.uuid4().hex, _free_port()
+    env = {**os.environ, "SEARCH_TEST_TAG": tag, "SEARCH_WORKERS": "2"}
+    server = subprocess.Popen(
+        [sys.executable, SERVER, "--transport", "http", "--port", str(port), "--preload", str(tmp_path)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        end = time.monotonic() + 60
+        while not _port_open(port):
+            assert server.poll() is None and time.monotonic() < end, "server did not start"
+            time.sleep(0.2)
+        client = MCPClient(f"http://127.0.0.1:{port}/mcp", timeout=30)
+        hits = _hits(client.call("search_budget_text", {"keyword": "revenue", "structured_json_path": str(tmp_path)}))
+        assert len(hits) == 18
+        client.close()
+        # The server and its preloaded pool of two workers (plus multiprocessing helpers).
+        assert len(_tagged_processes(tag)) >= 3
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    assert _wait_gone(tag) == []
@@ -0,0 +1,134 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from utils import prompts
+from utils.model import AnswerCacheConfig
+
+
+def prompt_fingerprint() -> str:
+    """Hash of every prompt constant in utils/prompts.py; editing a prompt invalidates cached answers."""
+    h = hashlib.sha256()
+    for name in sorted(n for n in dir(prompts) if n.isupper()):
+        value = getattr(prompts, name)
+        if isinstance(value, str):
+            h.update(name.encode())
+            h.update(value.encode())
+    return h.hexdigest()
+
+
+_doc_hashes: Dict[str, Tuple[Tuple[int, int], str]] = {}
+_doc_hash_lock = threading.Lock()
+
+
+def document_hash(path: str) -> str:
+    """Content hash of `path`; re-hashed only when the file changes on disk."""
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _doc_hash_lock:
+        cached = _doc_hashes.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    with _doc_hash_lock:
+        _doc_hashes[path] = (stamp, h.hexdigest())
+    return h.hexdigest()
+
+
+def content_version(document_path: str, model_name: str) -> str:
+    """Version of everything an answer depends on besides the query: document content, prompts and model."""
+    parts = [document_hash(document_path), prompt_fingerprint(), model_name]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+class AnswerCache:
+    """
+    Persistent query -> answer cache with LRU eviction and TTL.
+
+    Keys combine the normalized query with a content hash of the extracted
+    document, the prompt fingerprint and the model name, so re-parsing the PDF
+    or editing a prompt makes old entries unreachable; they then age out.
+    """
+
+    def __init__(self, config: AnswerCacheConfig, document_path: str, model_name: str):
+        self.config = config
+        self.document_path = document_path
+        self.model_name = model_name
+        self._prompt_hash = prompt_fingerprint()
+        self._synonyms = {self._fold(k): self._fold(v) for k, v in config.synonyms.items()}
+        # Single pass, longest phrases first so "future energy fund" wins over "fund".
+        self._synonym_re = re.compile(
+            r"\b(" + "|".join(re.escape(k) for k in sorted(self._synonyms, key=len, reverse=True)) + r")\b"
+        ) if self._synonyms else None
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(config.path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(config.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, query TEXT, answer TEXT, created_at REAL, last_access REAL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _fold(text: str) -> str:
+        """Case, punctuation and whitespace folding."""
+        text = re.sub(r"[^\w\s]", " ", text.lower())
+        return " ".join(text.split())
+
+    def normalize_query(self, query: str) -> str:
+        text = self._fold(query)
+        if self._synonym_re is not None:
+            text = self._synonym_re.sub(lambda m: self._synonyms[m.group(1)], text)
+        return text
+
+    def key(self, query: str) -> str:
+        parts = [self.normalize_query(query), document_hash(self.document_path), self._prompt_hash, self.model_name]
+        return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+    def get(self, query: str) -> Optional[Dict[str, Any]]:
+        key = self.key(query)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT answer, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            answer, created_at = row
+            if now - created_at > self.config.ttl_s:
+                self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(answer)
+
+    def put(self, query: str, answer: Dict[str, Any]) -> None:
+        key = self.key(query)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, query, answer, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, query, json.dumps(answer, ensure_ascii=False), now, now),
+            )
+            self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.config.ttl_s,))
+            self._conn.execute(
+                "DELETE FROM answers WHERE key IN ("
+                "SELECT key FROM answers ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.config.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
@@ -2,11 +2,9 @@ import os
 import base64
 from typing import Optional, Dict, Any
 from pydantic import BaseModel, Field
-from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage
 
-load_dotenv()
+from utils.model_provider import get_model_provider
 
 
 class GeminiResponse(BaseModel):
@@ -23,14 +21,15 @@ class GeminiAPIClient:
       • Multimodal (image + text) prompts
     """
 
-    def __init__(self, model: str = "gemini-2.5-flash", temperature: float = 0.2):
+    def __init__(self, model: Optional[str] = None, temperature: float = 0.2, priority: str = "batch"):
         api_key = os.getenv("GOOGLE_API_KEY")
         if not api_key:
             raise ValueError("Missing GOOGLE_API_KEY in environment variables.")
-        self.llm = ChatGoogleGenerativeAI(
+        self.llm = get_model_provider().chat_model(
             model=model,
             temperature=temperature,
-            convert_system_message_to_human=True
+            priority=priority,
+            convert_system_message_to_human=True,
         )
 
     def generate_content(
@@ -66,5 +65,7 @@ class GeminiAPIClient:
             )
 
         except Exception as e:
+            # Transient errors were already retried by the model's call policy; surface the
+            # failure instead of returning empty text that would be saved as page content.
             print(f"[ERROR] LangChain Gemini failed: {e}")
-            return GeminiResponse(text="", metadata={"error": str(e)})
+            raise
@@ -0,0 +1,166 @@
+import json
+import threading
+import contextlib
+import contextvars
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from utils.model import ContextBudgetConfig
+
+# Gemini averages roughly four characters per token on English prose; close enough
+# for budgeting and free, unlike a count_tokens round trip per prompt.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to about `max_tokens`, preferring a line or sentence boundary."""
+    text = text or ""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    boundary = max(cut.rfind("\n"), cut.rfind(". "))
+    if boundary > limit // 2:
+        cut = cut[:boundary + 1]
+    return cut.rstrip() + " ...[truncated]"
+
+
+def _finding_items(finding: Any) -> List[str]:
+    """Split a worker finding into items: one per search hit, or one per non-empty line."""
+    if isinstance(finding, str):
+        try:
+            parsed = json.loads(finding)
+        except json.JSONDecodeError:
+            parsed = None
+        if isinstance(parsed, (list, dict)):
+            finding = parsed
+    if isinstance(finding, dict):
+        finding = [finding]
+    if isinstance(finding, list):
+        items = []
+        for hit in finding:
+            if isinstance(hit, dict) and "text" in hit:
+                items.append(f"[{hit.get('doc_id', 'doc')} p.{hit.get('page', '?')}] {hit['text']}")
+            elif isinstance(hit, dict) and "note" in hit:
+                continue
+            else:
+                items.append(str(hit))
+        return [" ".join(item.split()) for item in items if item.strip()]
+    return [line.strip().lstrip("-*• ").strip() for line in str(finding or "").splitlines() if line.strip().lstrip("-*• ")]
+
+
+class ContextBudget:
+    """
+    Per-run context manager for the supervisor loop: keeps worker findings as
+    bounded item lists, dedupes and truncates search results within one agent
+    invocation, and keeps a per-loop record of prompt sizes.
+    """
+
+    def __init__(self, config: ContextBudgetConfig):
+        self.config = config
+        self.reports: List[Dict[str, Any]] = []
+        self._seen: Set[Tuple[Any, Any]] = set()
+        self._lock = threading.Lock()
+
+    def compact_finding(self, finding: Any) -> str:
+        """
+        Bounded summary of a worker finding: a bullet list of distinct items
+        (search hits become "[doc p.N] excerpt"), each capped, kept in order
+        until the finding budget is spent. Extractive, so no extra model call.
+        """
+        items, seen, used = [], set(), 0
+        candidates = _finding_items(finding)
+        for i, item in enumerate(candidates):
+            if item in seen:
+                continue
+            seen.add(item)
+            item = truncate_to_tokens(item, self.config.max_finding_item_tokens)
+            cost = estimate_tokens(item)
+            if items and used + cost > self.config.max_finding_tokens:
+                items.append(f"...[{len(candidates) - i} more items omitted]")
+                break
+            items.append(truncate_to_tokens(item, self.config.max_finding_tokens))
+            used += cost
+        return "\n".join(item if item.startswith("...[") else f"- {item}" for item in items)
+
+    def compact_reasoning(self, text: Any) -> str:
+        return truncate_to_tokens(str(text or ""), self.config.max_reasoning_tokens)
+
+    @contextlib.contextmanager
+    def agent_invocation(self) -> Iterator[None]:
+        """
+        Scope search-hit dedupe to one worker agent invocation. Each invocation
+        starts from a fresh message history and its tool output becomes the
+        finding, so a page seen on an earlier visit must be returned in full again.
+        """
+        with self._lock:
+            self._seen = set()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._seen = set()
+
+    def compact_tool_result(self, result: Any) -> Any:
+        """Drop repeats of pages already returned in this agent invocation and cap the rest."""
+        hits = result
+        if isinstance(result, str):
+            try:
+                hits = json.loads(result)
+            except json.JSONDecodeError:
+                return truncate_to_tokens(result, self.config.max_tool_hit_tokens * self.config.max_tool_hits)
+        if isinstance(hits, dict):
+            hits = [hits]
+        if not isinstance(hits, list):
+            return result
+
+        compacted = []
+        with self._lock:
+            for hit in hits[:self.config.max_tool_hits]:
+                if not isinstance(hit, dict):
+                    compacted.append(hit)
+                    continue
+                key = (hit.get("doc_id"), hit.get("page"))
+                if key in self._seen:
+                    compacted.append({**hit, "text": "(already returned by another search in this step)"})
+                    continue
+                self._seen.add(key)
+                compacted.append({**hit, "text": truncate_to_tokens(hit.get("text", ""), self.config.max_tool_hit_tokens)})
+        omitted = len(hits) - self.config.max_tool_hits
+        if omitted > 0:
+            compacted.append({"note": f"{omitted} more matches omitted; use a more specific keyword or filters."})
+        return compacted
+
+    def record(self, loop: int, prompt: str, text: str) -> int:
+        """Log the estimated size of a prompt sent in loop `loop`."""
+        tokens = estimate_tokens(text)
+        with self._lock:
+            self.reports.append({"loop": loop, "prompt": prompt, "tokens": tokens})
+        print(f"[CONTEXT] loop {loop} {prompt} prompt: ~{tokens} tokens")
+        return tokens
+
+    def summary(self) -> str:
+        """Router prompt size per loop; should stay roughly flat as loops increase."""
+        router = [f"{r['loop']}:{r['tokens']}" for r in self.reports if r["prompt"] == "router"]
+        return "router prompt tokens by loop -> " + (", ".join(router) or "none")
+
+
+_current_budget: contextvars.ContextVar[Optional[ContextBudget]] = contextvars.ContextVar("context_budget", default=None)
+
+
+def current_context_budget() -> Optional[ContextBudget]:
+    return _current_budget.get()
+
+
+@contextlib.contextmanager
+def context_budget_scope(config: ContextBudgetConfig) -> Iterator[ContextBudget]:
+    """Start a fresh context budget for one query run."""
+    budget = ContextBudget(config)
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
@@ -0,0 +1,175 @@
+import time
+import random
+import contextlib
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Iterator, Optional, TypeVar
+
+from utils.model import ResilienceConfig
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the per-query time budget has run out."""
+
+
+class Deadline:
+    """Absolute point in time by which a query must be answered."""
+
+    def __init__(self, budget_s: float):
+        self.budget_s = budget_s
+        self.expires_at = time.monotonic() + budget_s
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, what: str = "call") -> None:
+        if self.expired():
+            raise DeadlineExceeded(f"Query deadline of {self.budget_s:g}s exceeded before {what}.")
+
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline of the query running in this context, if any."""
+    return _current_deadline.get()
+
+
+@contextlib.contextmanager
+def deadline_scope(budget_s: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """Set the query deadline for every LLM and MCP call made inside the block."""
+    deadline = Deadline(budget_s) if budget_s else None
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+_TRANSIENT_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "ServerError", "ConnectError", "ReadTimeout",
+}
+
+_TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+
+
+def is_transient(error: BaseException) -> bool:
+    """Rate limits, 5xx and network errors are worth retrying; anything else is not."""
+    while error is not None:
+        if isinstance(error, DeadlineExceeded):
+            return False
+        if isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in _TRANSIENT_NAMES:
+            return True
+        status = getattr(error, "status_code", None) or getattr(error, "code", None)
+        if status in _TRANSIENT_STATUS or any(marker in str(error) for marker in ("RESOURCE_EXHAUSTED", "UNAVAILABLE")):
+            return True
+        error = error.__cause__
+    return False
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies used to pick the hedge delay."""
+
+    def __init__(self, config: ResilienceConfig):
+        self.config = config
+        self._samples: deque = deque(maxlen=config.hedge_window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def hedge_delay(self) -> float:
+        if len(self._samples) < self.config.hedge_min_samples:
+            return self.config.hedge_initial_delay_s
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(self.config.hedge_quantile * len(ordered)))
+        return max(self.config.hedge_min_delay_s, ordered[idx])
+
+
+class CallPolicy:
+    """
+    Runs one logical LLM call as one or more attempts:
+    - abandons the call when the query deadline runs out,
+    - fires a hedged duplicate when the first attempt is slower than the p95 latency,
+    - retries transient errors with full-jitter exponential backoff.
+    """
+
+    def __init__(self, config: ResilienceConfig):
+        self.config = config
+        self.latency = LatencyTracker(config)
+        self._pool = ThreadPoolExecutor(max_workers=config.max_parallel_attempts, thread_name_prefix="llm-attempt")
+
+    def _timed(self, attempt: Callable[[], T]) -> T:
+        start = time.monotonic()
+        result = attempt()
+        self.latency.record(time.monotonic() - start)
+        return result
+
+    def _submit(self, attempt: Callable[[], T]):
+        # Attempts run on pool threads; copy the context so tracing and the deadline follow them.
+        return self._pool.submit(contextvars.copy_context().run, self._timed, attempt)
+
+    def _hedged(
+        self,
+        attempt: Callable[[], T],
+        deadline: Optional[Deadline],
+        acquire_slot: Optional[Callable[[bool], bool]],
+    ) -> T:
+        pending = {self._submit(attempt)}
+        hedge_at = time.monotonic() + self.latency.hedge_delay() if self.config.hedge else None
+        last_error: Optional[BaseException] = None
+
+        while pending:
+            timeouts = []
+            if deadline is not None:
+                timeouts.append(deadline.remaining())
+            if hedge_at is not None:
+                timeouts.append(max(0.0, hedge_at - time.monotonic()))
+            done, pending = wait(pending, timeout=min(timeouts) if timeouts else None, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                last_error = future.exception()
+
+            if deadline is not None and deadline.expired():
+                for other in pending:
+                    other.cancel()
+                raise DeadlineExceeded(f"Query deadline of {deadline.budget_s:g}s exceeded during LLM call.")
+
+            if hedge_at is not None and pending and time.monotonic() >= hedge_at:
+                hedge_at = None
+                # Hedges spend quota too: only fire one if the scheduler has a slot free right now.
+                if acquire_slot is None or acquire_slot(False):
+                    print("[INFO] LLM call slower than expected, sending hedged request.")
+                    pending.add(self._submit(attempt))
+
+        raise last_error
+
+    def run(self, attempt: Callable[[], T], acquire_slot: Optional[Callable[[bool], bool]] = None) -> T:
+        deadline = current_deadline()
+        retries = 0
+        while True:
+            if deadline is not None:
+                deadline.check("LLM call")
+            try:
+                return self._hedged(attempt, deadline, acquire_slot)
+            except Exception as e:
+                if not is_transient(e) or retries >= self.config.max_retries:
+                    raise
+                retries += 1
+                delay = random.uniform(0, min(self.config.backoff_max_s, self.config.backoff_base_s * 2 ** (retries - 1)))
+                if deadline is not None and delay >= deadline.remaining():
+                    raise DeadlineExceeded("Query deadline would be exceeded while backing off.") from e
+                print(f"[WARN] Transient LLM error ({type(e).__name__}); retry {retries}/{self.config.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                if acquire_slot is not None:
+                    acquire_slot(True)
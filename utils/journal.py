@@ -0,0 +1,72 @@
+import os
+import json
+import hashlib
+from typing import Any, Dict
+
+
+def file_fingerprint(path: str) -> str:
+    """
+    Identity for an input file: path, size and a hash of its content. Content
+    rather than mtime, so a stage output rewritten with the same content keeps
+    the downstream journals valid.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return f"{os.path.abspath(path)}:{os.path.getsize(path)}:{digest.hexdigest()[:16]}"
+
+
+class ProgressJournal:
+    """
+    Append-only JSONL record of completed work units (pages, elements) for one
+    stage run. The file name is derived from the stage inputs, so a restarted
+    run over the same inputs picks up the journal and skips finished units,
+    while changed inputs start a fresh journal.
+    """
+
+    def __init__(self, directory: str, stage: str, *identity: Any):
+        digest = hashlib.sha256(json.dumps(identity, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{stage}-{digest}.jsonl")
+        self._done: Dict[str, Any] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash mid-write leaves a truncated last line; that unit is simply redone.
+                        continue
+                    self._done[entry["unit"]] = entry["result"]
+            # Terminate a truncated last line so the next record starts on its own line.
+            with open(self.path, "rb+") as f:
+                if f.seek(0, os.SEEK_END) > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+            if self._done:
+                print(f"[INFO] Resuming {stage}: {len(self._done)} unit(s) already completed ({self.path})")
+
+    def __contains__(self, unit: str) -> bool:
+        return unit in self._done
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def get(self, unit: str) -> Any:
+        return self._done[unit]
+
+    def record(self, unit: str, result: Any) -> None:
+        """Durably record a completed unit before moving on to the next one."""
+        self._done[unit] = result
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"unit": unit, "result": result}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def complete(self) -> None:
+        """Remove the journal once the stage output has been written."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._done = {}
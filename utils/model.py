@@ -1,8 +1,51 @@
 
 from typing import List, Dict, Any, Optional, Literal, Annotated, TypedDict
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, validator, AliasChoices
 import os
 
+# All parts
+class RateLimitConfig(BaseModel):
+    """Project-wide Gemini quota shared by every model client."""
+    requests_per_minute: float = Field(10, description="Request budget (RPM) for the project quota")
+    tokens_per_minute: float = Field(250000, description="Token budget (TPM) for the project quota")
+
+
+class CheckpointConfig(BaseModel):
+    """Durable progress so failed runs resume instead of starting over."""
+    enabled: bool = Field(True, description="Journal stage progress and checkpoint QA graph runs")
+    dir: str = Field("./data/checkpoints", description="Directory for stage journals and the graph checkpoint DB")
+
+
+class ResilienceConfig(BaseModel):
+    """Deadline, hedging and retry policy for LLM and MCP calls."""
+    query_deadline_s: float = Field(180, description="Time budget for one Q&A query, shared by every call it makes")
+    reviewer_reserve_s: float = Field(20, description="Budget kept back so the reviewer can still answer with partial findings")
+    max_retries: int = Field(3, description="Retries for transient errors (429, 5xx, network)")
+    backoff_base_s: float = Field(1.0, description="First retry backoff ceiling; doubles each retry, with full jitter")
+    backoff_max_s: float = Field(20.0, description="Upper bound on a single backoff")
+    hedge: bool = Field(True, description="Send a duplicate request when the first is slower than usual")
+    hedge_quantile: float = Field(0.95, description="Latency quantile after which a hedge fires")
+    hedge_initial_delay_s: float = Field(15.0, description="Hedge delay until enough latencies are observed")
+    hedge_min_delay_s: float = Field(2.0, description="Lower bound on the hedge delay")
+    hedge_min_samples: int = Field(20, description="Latency samples needed before the quantile is trusted")
+    hedge_window: int = Field(200, description="Number of recent latencies kept")
+    max_parallel_attempts: int = Field(32, description="Threads available for in-flight and hedged attempts")
+
+
+class MCPServersConfig(BaseModel):
+    """Where each MCP tool server lives: a script path (stdio child per call) or a URL of a shared server."""
+    search: str = Field("mcp_server/search_budget_server.py", description="search_budget_server script path or streamable HTTP URL")
+    normalize_date: str = Field("mcp_server/normalize_date_server.py", description="normalize_date_server script path or streamable HTTP URL")
+
+
+class ModelProviderConfig(BaseModel):
+    gemini_model: str = Field("gemini-2.5-flash", description="Default Gemini model handed out by the provider")
+    rate_limits: RateLimitConfig = Field(default_factory=RateLimitConfig)
+    resilience: ResilienceConfig = Field(default_factory=ResilienceConfig)
+
+    class Config:
+        extra = "ignore"
+
 # Part 1
 class FinancialFields(BaseModel):
     """Structured schema for extracted financial metrics."""
@@ -18,6 +61,9 @@ class ConfigModel(BaseModel):
     extracted_text_path: str = Field(..., description="Path to extracted JSON text file")
     target_pages_part_2: List[int] = Field(..., description="Pages to process for normalization + summarization")
     output_dir: Optional[str] = Field("outputs", description="Directory for saving outputs")
+    gemini_model: str = Field("gemini-2.5-flash", description="Gemini model used for normalization and reasoning")
+    checkpoint: CheckpointConfig = Field(default_factory=CheckpointConfig)
+    mcp_servers: MCPServersConfig = Field(default_factory=MCPServersConfig)
 
     class Config:
         extra = "ignore" 
@@ -69,8 +115,46 @@ class BudgetState(TypedDict, total=False):
     final_output: Optional[FinalAnswer]
     loop_count: int
     last_node: Optional[str]
+    degraded: bool
+
+class AnswerCacheConfig(BaseModel):
+    """Query-level answer cache in front of BudgetSupervisorPipeline.run()."""
+    enabled: bool = Field(True, description="Serve repeat questions from the cache")
+    path: str = Field("./data/answer_cache.sqlite", description="SQLite file holding cached answers")
+    max_entries: int = Field(256, description="Entries kept before least-recently-used ones are evicted")
+    ttl_s: float = Field(7 * 24 * 3600, description="Seconds before a cached answer expires")
+    synonyms: Dict[str, str] = Field(default_factory=dict, description="Phrase -> canonical phrase applied when normalizing queries")
+
+
+class ContextBudgetConfig(BaseModel):
+    """Bounds on what the supervisor loop carries from one loop to the next."""
+    max_finding_tokens: int = Field(1200, description="Cap on each worker's revenue/expenditure finding")
+    max_finding_item_tokens: int = Field(150, description="Cap on each item (line or search hit) kept in a finding")
+    max_reasoning_tokens: int = Field(200, description="Cap on the supervisor reasoning carried in state")
+    max_tool_hit_tokens: int = Field(400, description="Cap on the text of each search hit returned to an agent")
+    max_tool_hits: int = Field(8, description="Search hits returned per tool call")
+
 
 class Part3ConfigModel(BaseModel):
     extracted_text_path: str
+    corpus_dir: Optional[str] = Field(None, description="Sharded multi-document corpus; searched instead of extracted_text_path when set")
     max_loop: int = Field(default=5)
-    model_name: str = Field(default="gemini-2.5-flash")
\ No newline at end of file
+    model_name: str = Field(
+        default="gemini-2.5-flash",
+        validation_alias=AliasChoices("model_name", "gemini_model"),
+    )
+    answer_cache: AnswerCacheConfig = Field(default_factory=AnswerCacheConfig)
+    checkpoint: CheckpointConfig = Field(default_factory=CheckpointConfig)
+    resilience: ResilienceConfig = Field(default_factory=ResilienceConfig)
+    context_budget: ContextBudgetConfig = Field(default_factory=ContextBudgetConfig)
+    mcp_servers: MCPServersConfig = Field(default_factory=MCPServersConfig)
+
+
+class ServiceConfigModel(BaseModel):
+    """Settings for the long-lived local HTTP service (chains.qa_service)."""
+    host: str = Field("127.0.0.1", description="Interface to bind")
+    port: int = Field(8000, description="Port to listen on")
+    max_concurrency: int = Field(4, description="Requests executed at the same time")
+    max_queue: int = Field(32, description="Requests allowed to wait for a slot before rejecting with 503")
+    request_timeout_s: float = Field(120.0, description="Per-request deadline, including time spent queued")
+    shutdown_grace_s: float = Field(30.0, description="Time allowed for in-flight requests to finish on shutdown")
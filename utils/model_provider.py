@@ -0,0 +1,311 @@
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import yaml
+from pydantic import Field
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import ChatGenerationChunk, ChatResult, LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from utils.model import ModelProviderConfig
+from utils.deadline import CallPolicy, Deadline, DeadlineExceeded, current_deadline
+
+# Lower rank is served first: interactive QA jumps ahead of batch OCR/extraction.
+PRIORITIES: Dict[str, int] = {"interactive": 0, "batch": 1}
+
+
+class TokenBucket:
+    """Continuously refilling bucket; `level` may go negative to record debt."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.level = self.capacity
+        self._last = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._last) * self.rate)
+        self._last = now
+
+    def seconds_until(self, amount: float) -> float:
+        """Seconds until the bucket holds at least `amount`."""
+        missing = amount - self.level
+        return max(0.0, missing / self.rate) if self.rate > 0 else float("inf")
+
+
+class RateLimitScheduler:
+    """
+    Global admission control for every Gemini call in the process.
+    Keeps separate request (RPM) and token (TPM) budgets and admits waiting
+    calls strictly in priority order, then FIFO within a priority class.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._cond = threading.Condition()
+        self._waiting: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._depth = {p: 0 for p in PRIORITIES}
+        self._max_depth = {p: 0 for p in PRIORITIES}
+        self._admitted = {p: 0 for p in PRIORITIES}
+        self._wait_seconds = {p: 0.0 for p in PRIORITIES}
+        self._tokens_used = 0
+
+    def _can_admit(self) -> bool:
+        # Token usage is only known after the call, so admit while the token
+        # bucket is not in debt and let record_usage() settle the bill.
+        return self._requests.level >= 1 and self._tokens.level > 0
+
+    def _time_until_admit(self) -> float:
+        wait = max(self._requests.seconds_until(1), self._tokens.seconds_until(1e-9))
+        return min(max(wait, 0.01), 1.0)
+
+    def acquire(self, priority: str = "batch", blocking: bool = True, deadline: Optional[Deadline] = None) -> bool:
+        """
+        Wait for a request slot. Returns False only when non-blocking and no slot is free.
+        Raises DeadlineExceeded, and gives up its place, if `deadline` passes while queued.
+        """
+
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'. Expected one of {list(PRIORITIES)}.")
+        ticket = (PRIORITIES[priority], next(self._seq))
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            self._depth[priority] += 1
+            self._max_depth[priority] = max(self._max_depth[priority], self._depth[priority])
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._requests.refill(now)
+                    self._tokens.refill(now)
+                    if self._waiting[0] == ticket and self._can_admit():
+                        heapq.heappop(self._waiting)
+                        self._requests.level -= 1
+                        self._admitted[priority] += 1
+                        self._wait_seconds[priority] += now - start
+                        self._cond.notify_all()
+                        return True
+                    expired = deadline is not None and deadline.expired()
+                    if not blocking or expired:
+                        self._waiting.remove(ticket)
+                        heapq.heapify(self._waiting)
+                        self._cond.notify_all()
+                        if expired:
+                            raise DeadlineExceeded(f"Query deadline of {deadline.budget_s:g}s exceeded waiting for a rate-limit slot.")
+                        return False
+                    wait = self._time_until_admit()
+                    if deadline is not None:
+                        wait = min(wait, max(deadline.remaining(), 0.001))
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._depth[priority] -= 1
+
+    async def aacquire(self, priority: str = "batch", blocking: bool = True, deadline: Optional[Deadline] = None) -> bool:
+        # Waiting in a worker thread keeps the caller's place in the priority queue
+        # without blocking the event loop.
+        return await asyncio.to_thread(self.acquire, priority, blocking, deadline)
+
+    def record_usage(self, tokens: int) -> None:
+        """Debit tokens actually consumed by a completed call."""
+        if tokens <= 0:
+            return
+        with self._cond:
+            self._tokens.refill(time.monotonic())
+            self._tokens.level -= tokens
+            self._tokens_used += tokens
+            self._cond.notify_all()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            return {
+                "queue_depth": dict(self._depth),
+                "max_queue_depth": dict(self._max_depth),
+                "admitted": dict(self._admitted),
+                "avg_wait_seconds": {
+                    p: (self._wait_seconds[p] / self._admitted[p]) if self._admitted[p] else 0.0
+                    for p in PRIORITIES
+                },
+                "requests_available": round(self._requests.level, 2),
+                "tokens_available": round(self._tokens.level, 2),
+                "tokens_used": self._tokens_used,
+            }
+
+
+class PriorityRateLimiter(BaseRateLimiter):
+    """LangChain rate limiter bound to one priority class of the shared scheduler."""
+
+    def __init__(self, scheduler: RateLimitScheduler, priority: str):
+        self.scheduler = scheduler
+        self.priority = priority
+
+    # LangChain acquires a slot before calling the model, outside the call policy,
+    # so the query deadline is applied to the queue wait here.
+    def acquire(self, *, blocking: bool = True) -> bool:
+        return self.scheduler.acquire(self.priority, blocking, current_deadline())
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        return await self.scheduler.aacquire(self.priority, blocking, current_deadline())
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Reports token usage of finished calls back to the scheduler's token budget."""
+
+    def __init__(self, scheduler: RateLimitScheduler):
+        self.scheduler = scheduler
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        total = 0
+        for generations in response.generations:
+            for gen in generations:
+                usage = getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+                total += usage.get("total_tokens", 0)
+        self.scheduler.record_usage(total)
+
+
+class ResilientChatGoogleGenerativeAI(ChatGoogleGenerativeAI):
+    """
+    ChatGoogleGenerativeAI whose calls honour the current query deadline,
+    hedge slow responses and retry transient errors (see utils.deadline.CallPolicy).
+    """
+
+    call_policy: Optional[Any] = Field(default=None, exclude=True)
+
+    def _acquire_slot(self):
+        limiter = self.rate_limiter
+        return (lambda blocking: limiter.acquire(blocking=blocking)) if limiter else None
+
+    @staticmethod
+    def _attempt_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Cap the HTTP request timeout at the remaining deadline, so abandoned attempts end too."""
+        deadline = current_deadline()
+        if deadline is None:
+            return kwargs
+        remaining = max(deadline.remaining(), 0.001)
+        return {**kwargs, "timeout": min(kwargs.get("timeout") or remaining, remaining)}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        parent = super()._generate
+        if self.call_policy is None:
+            return parent(messages, stop=stop, run_manager=run_manager, **kwargs)
+        return self.call_policy.run(
+            lambda: parent(messages, stop=stop, run_manager=run_manager, **self._attempt_kwargs(kwargs)),
+            acquire_slot=self._acquire_slot(),
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        parent = super()._stream
+        if self.call_policy is None:
+            yield from parent(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return
+
+        def first_chunk():
+            chunks = parent(messages, stop=stop, run_manager=run_manager, **self._attempt_kwargs(kwargs))
+            return chunks, next(chunks, None)
+
+        # Retries and hedging apply until the first chunk arrives; after that the
+        # response is committed and only the deadline is enforced between chunks.
+        chunks, first = self.call_policy.run(first_chunk, acquire_slot=self._acquire_slot())
+        if first is None:
+            return
+        yield first
+        deadline = current_deadline()
+        for chunk in chunks:
+            if deadline is not None:
+                deadline.check("the rest of a streamed LLM response")
+            yield chunk
+
+
+class ModelProvider:
+    """
+    Hands out configured Gemini chat models.
+    One base client per model name owns the HTTP connection; variants for other
+    temperatures or priorities are shallow copies that reuse it. Every variant
+    is admitted through the same RateLimitScheduler.
+    """
+
+    def __init__(self, config: ModelProviderConfig):
+        self.config = config
+        self.scheduler = RateLimitScheduler(
+            requests_per_minute=config.rate_limits.requests_per_minute,
+            tokens_per_minute=config.rate_limits.tokens_per_minute,
+        )
+        self._usage_callback = TokenUsageCallback(self.scheduler)
+        self.call_policy = CallPolicy(config.resilience)
+        self._base: Dict[str, ResilientChatGoogleGenerativeAI] = {}
+        self._clients: Dict[Tuple[str, float, str, bool], ResilientChatGoogleGenerativeAI] = {}
+        self._lock = threading.Lock()
+
+    def chat_model(
+        self,
+        priority: str = "batch",
+        temperature: float = 0.0,
+        model: Optional[str] = None,
+        convert_system_message_to_human: bool = False,
+    ) -> ResilientChatGoogleGenerativeAI:
+        model = model or self.config.gemini_model
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'. Expected one of {list(PRIORITIES)}.")
+        key = (model, float(temperature), priority, convert_system_message_to_human)
+        with self._lock:
+            if key not in self._clients:
+                if model not in self._base:
+                    self._base[model] = ResilientChatGoogleGenerativeAI(
+                        model=model,
+                        temperature=0,
+                        # Retries are owned by the call policy so they respect the query deadline.
+                        max_retries=1,
+                        call_policy=self.call_policy,
+                    )
+                self._clients[key] = self._base[model].model_copy(
+                    update={
+                        "temperature": float(temperature),
+                        "convert_system_message_to_human": convert_system_message_to_human,
+                        "rate_limiter": PriorityRateLimiter(self.scheduler, priority),
+                        "callbacks": [self._usage_callback],
+                    }
+                )
+            return self._clients[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        return self.scheduler.metrics()
+
+
+_provider: Optional[ModelProvider] = None
+_provider_lock = threading.Lock()
+
+
+def configure_model_provider(config: Dict[str, Any]) -> ModelProvider:
+    """
+    Build the process-wide ModelProvider from an already loaded config dict.
+    Entry points call this with the file given by --config before creating any
+    model, so rate limits and resilience settings come from the same file as
+    the rest of the run.
+    """
+    global _provider
+    with _provider_lock:
+        _provider = ModelProvider(ModelProviderConfig(**(config or {})))
+        return _provider
+
+
+def get_model_provider(config_path: str = "config.yaml") -> ModelProvider:
+    """Return the process-wide ModelProvider, building it from `config_path` if no entry point configured one."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            try:
+                with open(config_path, "r", encoding="utf-8") as f:
+                    cfg = yaml.safe_load(f) or {}
+            except FileNotFoundError:
+                cfg = {}
+            _provider = ModelProvider(ModelProviderConfig(**cfg))
+        return _provider
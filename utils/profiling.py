@@ -0,0 +1,237 @@
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import functools
+import threading
+import contextlib
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+SAMPLE_INTERVAL_S = 0.01
+TOP_ALLOCATIONS = 25
+
+# Threads parked waiting for work, recognised by their role: each entry is the
+# innermost frames (path suffix, function), innermost first. Other waits (a
+# rate-limit slot, a hedged model call, a lock) are real stage time and are sampled.
+IDLE_STACKS = (
+    # Thread pool worker between work items (blocked in the C-level queue get).
+    (("concurrent/futures/thread.py", "_worker"),),
+    # MCP client stdout/stderr reader threads.
+    (("mcp_client/mcp_client.py", "_pump"),),
+    # Event loop with nothing ready to run.
+    (("selectors.py", "select"), ("asyncio/base_events.py", "_run_once")),
+    # Process pool manager thread waiting for results.
+    (("selectors.py", "select"), ("multiprocessing/connection.py", "wait"), ("concurrent/futures/process.py", "wait_result_broken_or_wakeup")),
+    # anyio worker thread (used by FastMCP/Starlette) between jobs.
+    (("threading.py", "wait"), ("queue.py", "get"), ("anyio/_backends/_asyncio.py", "run")),
+)
+
+
+def _is_idle(frame) -> bool:
+    """True if the thread whose innermost frame is `frame` is parked waiting for work."""
+    for pattern in IDLE_STACKS:
+        current = frame
+        for suffix, name in pattern:
+            if current is None or current.f_code.co_name != name or not current.f_code.co_filename.replace("\\", "/").endswith(suffix):
+                break
+            current = current.f_back
+        else:
+            return True
+    return False
+
+
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.samples: Counter = Counter()
+        self.idle_samples = 0
+        self.alloc_bytes: Counter = Counter()
+        self.alloc_blocks: Counter = Counter()
+
+
+class Profiler:
+    """
+    Opt-in, process-wide profiler for pipeline stages.
+    - A background thread samples the Python stack of every thread while any
+      stage is active. Samples are wall-clock: a thread blocked on I/O or a
+      lock counts like a running one. Threads parked waiting for work
+      (IDLE_STACKS) are counted separately and left out of the stacks, which
+      are written in collapsed form for flamegraph tools.
+    - tracemalloc snapshots taken around each stage give the net allocations
+      per source line.
+    - Wall time is split into CPU time and time blocked on I/O, network,
+      sleeps or locks (wall minus CPU).
+    Stages are attributed process-wide: work done by helper threads counts
+    towards every stage active at the time. Child processes are not covered.
+    """
+
+    def __init__(self, output_dir: str, interval_s: float = SAMPLE_INTERVAL_S, top_n: int = TOP_ALLOCATIONS):
+        self.output_dir = output_dir
+        self.interval_s = interval_s
+        self.top_n = top_n
+        self.stats: Dict[str, StageStats] = {}
+        self._active: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler_cpu = 0.0
+        self._reported = False
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+        self._sampler.start()
+
+    def _sample_loop(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            with self._lock:
+                active = [name for name, n in self._active.items() if n > 0]
+            if active:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                stacks, idle = [], 0
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    if _is_idle(frame):
+                        idle += 1
+                        continue
+                    frames = []
+                    while frame is not None:
+                        code = frame.f_code
+                        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                        frame = frame.f_back
+                    stacks.append(";".join([names.get(ident, str(ident))] + frames[::-1]))
+                with self._lock:
+                    for name in active:
+                        self.stats[name].samples.update(stacks)
+                        self.stats[name].idle_samples += idle
+            # Published so stages can leave the sampler's own CPU out of their CPU time.
+            self._sampler_cpu = time.thread_time()
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+
+    @contextlib.contextmanager
+    def stage(self, name: str, allocations: bool = True) -> Iterator[None]:
+        """Profile the enclosed block as `name`; repeated entries accumulate."""
+        # Snapshots are taken outside the timed and sampled window so their cost is not charged to the stage.
+        before = self._snapshot() if allocations else None
+        with self._lock:
+            self.stats.setdefault(name, StageStats())
+            self._active[name] += 1
+        wall, cpu, sampler_cpu = time.perf_counter(), time.process_time(), self._sampler_cpu
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = (time.process_time() - cpu) - (self._sampler_cpu - sampler_cpu)
+            with self._lock:
+                self._active[name] -= 1
+            diffs = self._snapshot().compare_to(before, "lineno") if before is not None else []
+            with self._lock:
+                stats = self.stats[name]
+                stats.calls += 1
+                stats.wall_s += wall
+                stats.cpu_s += max(0.0, cpu)
+                for diff in diffs[:self.top_n * 4]:
+                    if not diff.size_diff:
+                        continue
+                    where = str(diff.traceback)
+                    stats.alloc_bytes[where] += diff.size_diff
+                    stats.alloc_blocks[where] += diff.count_diff
+
+    def report(self) -> Dict[str, Any]:
+        """Write collapsed stacks, allocation reports and a summary; print a per-stage table."""
+        if self._reported:
+            return {}
+        self._reported = True
+        self._stop.set()
+        self._sampler.join(timeout=1)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        summary = {}
+        with self._lock:
+            stages = dict(self.stats)
+        for name, stats in stages.items():
+            fname = re.sub(r"[^\w.-]", "_", name)
+            with open(os.path.join(self.output_dir, f"{fname}.collapsed"), "w", encoding="utf-8") as f:
+                for stack, count in stats.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+
+            top = stats.alloc_bytes.most_common(self.top_n)
+            with open(os.path.join(self.output_dir, f"{fname}.alloc.txt"), "w", encoding="utf-8") as f:
+                f.write(f"Top {self.top_n} net allocations in stage '{name}' ({stats.calls} call(s))\n")
+                for where, size in top:
+                    f.write(f"{size / 1024:>12.1f} KiB {stats.alloc_blocks[where]:>10} blocks  {where}\n")
+
+            summary[name] = {
+                "calls": stats.calls,
+                "wall_s": round(stats.wall_s, 3),
+                "cpu_s": round(stats.cpu_s, 3),
+                "blocked_s": round(max(0.0, stats.wall_s - stats.cpu_s), 3),
+                "wall_clock_samples": sum(stats.samples.values()),
+                "idle_thread_samples": stats.idle_samples,
+                "net_alloc_kib": round(sum(stats.alloc_bytes.values()) / 1024, 1),
+            }
+
+        with open(os.path.join(self.output_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+        print(f"[PROFILE] {'stage':<24} {'calls':>6} {'wall s':>9} {'cpu s':>9} {'blocked s':>10} {'alloc KiB':>11}")
+        for name, row in sorted(summary.items(), key=lambda kv: -kv[1]["wall_s"]):
+            print(
+                f"[PROFILE] {name:<24} {row['calls']:>6} {row['wall_s']:>9.2f} {row['cpu_s']:>9.2f} "
+                f"{row['blocked_s']:>10.2f} {row['net_alloc_kib']:>11.1f}"
+            )
+        print(f"[PROFILE] Wall-clock collapsed stacks (idle threads excluded) and allocation reports written to: {self.output_dir}")
+        tracemalloc.stop()
+        return summary
+
+
+_profiler: Optional[Profiler] = None
+_profiler_lock = threading.Lock()
+
+
+def enable_profiling(output_dir: str) -> Profiler:
+    """Start the process-wide profiler; its report is written when the process exits."""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = Profiler(output_dir)
+            atexit.register(_profiler.report)
+        return _profiler
+
+
+def get_profiler() -> Optional[Profiler]:
+    return _profiler
+
+
+@contextlib.contextmanager
+def profile_stage(name: str, allocations: bool = True) -> Iterator[None]:
+    """Profile the block as stage `name` when profiling is enabled; otherwise a no-op."""
+    if _profiler is None:
+        yield
+        return
+    with _profiler.stage(name, allocations):
+        yield
+
+
+def profiled(name: str, allocations: bool = True) -> Callable[[F], F]:
+    """Decorator form of profile_stage."""
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profile_stage(name, allocations):
+                return func(*args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+    return decorator
@@ -50,6 +50,7 @@ REVENUE_AGENT_PROMPT = (
     "Search using keywords and synonyms like revenue, income, GST, etc., until you get the answer.\n"
     "Strictly only search using ONE keyword at a time."
     "Try minimum 5 different keywords, but only ONE keyword at a time."
+    "When the query is about particular fiscal years or documents, pass `years` or `doc_ids` to narrow the search.\n"
     "Summarize key government revenue sources and their values.\n"
 )
 
@@ -61,6 +62,7 @@ EXPENDITURE_AGENT_PROMPT = (
     "Search using keywords and synonyms like expenditure, spending, fund, or allocation.\n"
     "Strictly only search using ONE keyword at a time."
     "Try minimum 5 different keywords, but only ONE keyword at a time."
+    "When the query is about particular fiscal years or documents, pass `years` or `doc_ids` to narrow the search.\n"
     "Summarize fund allocations and how they are supported.\n"
 )
 